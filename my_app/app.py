@@ -1,21 +1,32 @@
 import streamlit as st
-from supabase import create_client
-import pandas as pd
-import numpy as np
-from datetime import datetime
-import requests
+from datetime import date, datetime, timedelta
 import io
-from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode
+import csv
+import asyncio
+import atexit
+from abc import ABC, abstractmethod
+import os
+import json
+import sqlite3
+import hashlib
+import unicodedata
+import pickle
+import tempfile
+from pathlib import Path
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import quote
+
+# pandas、supabase、openpyxl、requests、st_aggrid 等較重的套件只在用到的函式內載入，
+# 登入頁與只使用計價核心（pricing）的程式不需等待這些套件匯入
+from pricing import PRICE_CATALOG_PATH, GreenGardenProposal, load_price_catalog, load_price_history
 #st.write("Streamlit 版本:", st.__version__)
-# 頁面配置
-st.set_page_config(
-    page_title="規劃配置建議書",
-    page_icon="📋",
-    layout="wide"
-)
-
 # 樣式設置
-st.markdown("""
+PAGE_STYLE = """
 <style>
     .header-container {
         display: flex;
@@ -114,108 +125,1524 @@ st.markdown("""
     }
    
 </style>
-""", unsafe_allow_html=True)
+"""
+
+def configure_page():
+    """頁面配置與樣式（在 main 開頭執行，匯入 app 本身不會呼叫 Streamlit）"""
+    st.set_page_config(
+        page_title="規劃配置建議書",
+        page_icon="📋",
+        layout="wide"
+    )
+    st.markdown(PAGE_STYLE, unsafe_allow_html=True)
+
+def get_setting(key, default=None):
+    """讀取設定值：優先使用 st.secrets，其次為環境變數（大寫）"""
+    try:
+        if key in st.secrets:
+            return st.secrets[key]
+    except FileNotFoundError:
+        pass
+    return os.environ.get(key.upper(), default)
+
+def get_flag(key, default=False):
+    """讀取布林設定值（支援 true/1/yes 等字串）"""
+    value = get_setting(key, default)
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+class LRUCache:
+    """有容量上限的 LRU 快取，可選擇設定存活秒數；on_evict(key, value) 在項目因容量或過期被移除時呼叫"""
+
+    def __init__(self, maxsize=32, ttl_seconds=None, on_evict=None):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        value, expires_at = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._data[key]
+            if self.on_evict is not None:
+                self.on_evict(key, value)
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            evicted_key, (evicted, _) = self._data.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(evicted_key, evicted)
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self._data)
+
+def create_supabase_client(url, key, timeout=10.0, max_connections=10):
+    """建立使用 keep-alive 連線池的 Supabase client"""
+    import httpx
+    from supabase import ClientOptions, create_client
+
+    http_client = httpx.Client(
+        timeout=httpx.Timeout(timeout, connect=min(timeout, 5.0)),
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=60,
+        ),
+        follow_redirects=True,
+    )
+    return create_client(url, key, options=ClientOptions(httpx_client=http_client))
 
-def get_supabase(): 
+@st.cache_resource
+def get_supabase():
+    """程序共用的 Supabase client，跨 rerun 與 session 重複使用同一組連線"""
     url = st.secrets["supabase_url"]
     key = st.secrets["supabase_key"]
-    return create_client(url, key)
+    return create_supabase_client(
+        url, key,
+        timeout=float(get_setting("supabase_timeout", 10)),
+        max_connections=int(get_setting("supabase_max_connections", 10)),
+    )
+
+# ---------- Data scope ----------
+def apply_scope(query, scope):
+    """依資料範圍（例如 {"agent_id": "A123456789"}）加上等值篩選"""
+    for column, value in (scope or {}).items():
+        query = query.eq(column, value)
+    return query
+
+def get_customer_scope():
+    """目前登入業務可查詢的客戶範圍：預設為本人客戶，設定 customer_scope=office 時為整個營業處"""
+    if get_setting("customer_scope", "agent") == "office":
+        return {"office": st.session_state.agent_info.get("office", "")}
+    return {"agent_id": st.session_state.agent_id}
+
+def get_contact_log_scope():
+    """聯絡紀錄的查詢範圍（contact_logs 只有 agent_id 欄位，營業處範圍時不另外篩選）"""
+    scope = get_customer_scope()
+    return scope if "agent_id" in scope else None
+
+# ---------- Data repository ----------
+class CustomerRepository(ABC):
+    """客戶與聯絡紀錄的資料存取介面
+
+    查詢方法回傳 dict 列表（查詢失敗時回傳 None）；scope 為 {"欄位": 值} 的等值篩選。
+    """
+
+    # 寫入失敗時拋出的例外類型（供 except 使用）
+    errors = ()
+    # 伺服器單次回傳的筆數上限（None 為不限制）
+    max_rows = None
+
+    @abstractmethod
+    def fetch_customers(self, scope=None):
+        ...
+
+    @abstractmethod
+    def fetch_customers_page(self, after_id=None, limit=200, columns=None, scope=None, min_id=None):
+        ...
+
+    @abstractmethod
+    def search_customers(self, query, limit=50, scope=None):
+        ...
+
+    @abstractmethod
+    def fetch_latest_customer_update(self, scope=None):
+        ...
+
+    @abstractmethod
+    def fetch_customers_changed_since(self, since, scope=None, batch_size=500):
+        ...
+
+    @abstractmethod
+    def create_customer(self, customer):
+        ...
+
+    @abstractmethod
+    def upsert_customers(self, customers):
+        """批次新增客戶，與既有客戶衝突（client_key、電話、Email 唯一索引）的略過；回傳實際新增的客戶"""
+
+    @abstractmethod
+    def update_customer(self, customer_id, updates):
+        ...
+
+    @abstractmethod
+    def delete_customer(self, customer_id):
+        ...
+
+    @abstractmethod
+    def fetch_contact_logs(self, customer_id, scope=None):
+        ...
+
+    @abstractmethod
+    def fetch_contact_logs_page(self, customer_id, before=None, limit=20, scope=None):
+        ...
+
+    @abstractmethod
+    def fetch_contact_logs_batch(self, customer_ids, per_customer=None, scope=None):
+        ...
+
+    @abstractmethod
+    def create_contact_log(self, log):
+        ...
+
+    @abstractmethod
+    def update_contact_log(self, log_id, updates):
+        ...
+
+    @abstractmethod
+    def delete_contact_log(self, log_id):
+        ...
+
+    @abstractmethod
+    def fetch_export_page(self, table, after=None, limit=1000, filters=None):
+        """依主鍵遞增取得 after 之後的一頁匯出資料；filters 可含 agent_id、office、date_from、date_to"""
+
+    @abstractmethod
+    def insert_rows(self, table, rows):
+        """以 client_key 為冪等鍵批次新增（client_key 已存在的略過，其他衝突拋出例外），供延後寫入佇列使用"""
+
+    @abstractmethod
+    def update_rows(self, table, key_column, keys, updates):
+        """將 key_column 在 keys 之中的資料套用相同的修改，供延後寫入佇列使用"""
+
+    def is_conflict(self, error):
+        """寫入是否因資料本身違反限制（唯一索引、外鍵等）而失敗；這類錯誤重送也不會成功"""
+        return False
+
+# PostgreSQL 唯一索引衝突的 SQLSTATE
+UNIQUE_VIOLATION = "23505"
+
+class SupabaseRepository(CustomerRepository):
+    """以 Supabase（PostgREST）為資料來源"""
+
+    def __init__(self, client, use_rpc=False, max_rows=1000):
+        from postgrest import APIError
+
+        self.errors = (APIError,)
+        self.client = client
+        # 設定 contact_log_rpc 時以 latest_contact_logs RPC 取每位客戶最新幾筆（見 supabase_indexes.sql）
+        self.use_rpc = use_rpc
+        # PostgREST 的 db-max-rows（Supabase 預設 1000），超過的部分會被直接截掉
+        self.max_rows = max_rows
+
+    def fetch_customers(self, scope=None):
+        query = self.client.table("customers").select("*").order("id", desc=True)
+        return apply_scope(query, scope).execute().data
+
+    def fetch_customers_page(self, after_id=None, limit=200, columns=None, scope=None, min_id=None):
+        query = self.client.table("customers").select(",".join(columns or ["*"])).order("id", desc=True)
+        query = apply_scope(query, scope)
+        if min_id is not None:
+            query = query.gte("id", min_id)
+        else:
+            query = query.limit(limit)
+        if after_id is not None:
+            query = query.lt("id", after_id)
+        return query.execute().data
+
+    def search_customers(self, query, limit=50, scope=None):
+        pattern = f"*{query}*"
+        conditions = ",".join(f"{column}.ilike.{pattern}" for column in CUSTOMER_SEARCH_COLUMNS)
+        builder = (
+            self.client.table("customers")
+            .select(",".join(CUSTOMER_GRID_COLUMNS))
+            .or_(conditions)
+            .order("id", desc=True)
+            .limit(limit)
+        )
+        return apply_scope(builder, scope).execute().data
+
+    def fetch_latest_customer_update(self, scope=None):
+        query = self.client.table("customers").select("updated_at").order("updated_at", desc=True).limit(1)
+        rows = apply_scope(query, scope).execute().data or []
+        return rows[0]["updated_at"] if rows else None
+
+    def fetch_customers_changed_since(self, since, scope=None, batch_size=500):
+        changed = []
+        last_id = None
+        while True:
+            query = (
+                self.client.table("customers").select(",".join(CUSTOMER_SYNC_COLUMNS))
+                .order("updated_at").order("id").limit(batch_size)
+            )
+            if since is not None and last_id is None:
+                query = query.gt("updated_at", since)
+            elif since is not None:
+                query = query.or_(f'updated_at.gt."{since}",and(updated_at.eq."{since}",id.gt.{last_id})')
+            rows = apply_scope(query, scope).execute().data or []
+            changed.extend(rows)
+            if len(rows) < batch_size:
+                return changed
+            since, last_id = rows[-1]["updated_at"], rows[-1]["id"]
+
+    def create_customer(self, customer):
+        resp = self.client.table("customers").insert(customer).execute()
+        return resp.data[0] if resp.data else None
+
+    def upsert_customers(self, customers):
+        from postgrest import APIError
+
+        try:
+            return self._insert_new_customers(customers)
+        except APIError as e:
+            if e.code != UNIQUE_VIOLATION:
+                raise
+        # on_conflict 只能略過 client_key 的衝突；電話或 Email 唯一索引衝突時整批都不會寫入，
+        # 改為逐列重寫，衝突的列視為重複略過
+        inserted = []
+        for customer in customers:
+            try:
+                inserted.extend(self._insert_new_customers([customer]))
+            except APIError as e:
+                if e.code != UNIQUE_VIOLATION:
+                    raise
+        return inserted
+
+    def _insert_new_customers(self, customers):
+        resp = (
+            self.client.table("customers")
+            .upsert(customers, on_conflict="client_key", ignore_duplicates=True)
+            .execute()
+        )
+        # ignore_duplicates（ON CONFLICT DO NOTHING）只回傳實際新增的列
+        return resp.data or []
+
+    def update_customer(self, customer_id, updates):
+        # Prefer: return=minimal，不回傳整列資料；沒有拋出 APIError 即為成功
+        from postgrest import ReturnMethod
+
+        self.client.table("customers").update(updates, returning=ReturnMethod.minimal).eq("id", customer_id).execute()
+        return True
+
+    def delete_customer(self, customer_id):
+        resp = self.client.table("customers").delete().eq("id", customer_id).execute()
+        return bool(resp.data)
+
+    def fetch_contact_logs(self, customer_id, scope=None):
+        query = self.client.table("contact_logs").select("*").eq("id", customer_id).order("contact_date", desc=True)
+        return apply_scope(query, scope).execute().data or []
+
+    def fetch_contact_logs_page(self, customer_id, before=None, limit=20, scope=None):
+        query = (
+            self.client.table("contact_logs").select("*").eq("id", customer_id)
+            .order("contact_date", desc=True).order("contact_id", desc=True).limit(limit)
+        )
+        if before is not None:
+            contact_date, contact_id = before
+            query = query.or_(f'contact_date.lt."{contact_date}",and(contact_date.eq."{contact_date}",contact_id.lt.{contact_id})')
+        return apply_scope(query, scope).execute().data or []
+
+    def fetch_contact_logs_batch(self, customer_ids, per_customer=None, scope=None):
+        if per_customer and self.use_rpc:
+            params = {"customer_ids": customer_ids, "per_customer": per_customer, "agent": (scope or {}).get("agent_id")}
+            return self.client.rpc("latest_contact_logs", params).execute().data or []
+        query = (
+            self.client.table("contact_logs").select("*").in_("id", customer_ids)
+            .order("contact_date", desc=True).order("contact_id", desc=True)
+        )
+        if per_customer:
+            # PostgREST 無法限制每位客戶的筆數，以總筆數為上限（截斷時由 fetch_contact_logs_batch 補查）
+            query = query.limit(len(customer_ids) * per_customer)
+        return apply_scope(query, scope).execute().data or []
+
+    def create_contact_log(self, log):
+        resp = self.client.table("contact_logs").insert(log).execute()
+        return resp.data[0] if resp.data else None
+
+    def update_contact_log(self, log_id, updates):
+        resp = self.client.table("contact_logs").update(updates).eq("contact_id", log_id).execute()
+        return bool(resp.data)
+
+    def delete_contact_log(self, log_id):
+        resp = self.client.table("contact_logs").delete().eq("contact_id", log_id).execute()
+        return bool(resp.data)
+
+    def fetch_export_page(self, table, after=None, limit=1000, filters=None):
+        key, date_column = EXPORT_TABLES[table]
+        filters = filters or {}
+        query = self.client.table(table)
+        if table == "contact_logs" and filters.get("office"):
+            # contact_logs 沒有 office 欄位，以 inner join 客戶（contact_logs.id -> customers.id）篩選營業處
+            query = query.select("*,customers!inner(office)").eq("customers.office", filters["office"])
+        else:
+            query = query.select("*")
+            if filters.get("office"):
+                query = query.eq("office", filters["office"])
+        if filters.get("agent_id"):
+            query = query.eq("agent_id", filters["agent_id"])
+        if filters.get("date_from"):
+            query = query.gte(date_column, filters["date_from"])
+        if filters.get("date_to"):
+            query = query.lt(date_column, filters["date_to"])
+        if after is not None:
+            query = query.gt(key, after)
+        rows = query.order(key).limit(limit).execute().data or []
+        for row in rows:
+            row.pop("customers", None)
+        return rows
+
+    def insert_rows(self, table, rows):
+        from postgrest import ReturnMethod
+
+        (
+            self.client.table(table)
+            .upsert(rows, on_conflict="client_key", ignore_duplicates=True, returning=ReturnMethod.minimal)
+            .execute()
+        )
+
+    def update_rows(self, table, key_column, keys, updates):
+        from postgrest import ReturnMethod
+
+        query = self.client.table(table).update(updates, returning=ReturnMethod.minimal)
+        query = query.eq(key_column, keys[0]) if len(keys) == 1 else query.in_(key_column, keys)
+        query.execute()
+
+    def is_conflict(self, error):
+        # SQLSTATE 23 類：違反完整性限制（唯一索引、外鍵、NOT NULL 等）
+        return isinstance(error, self.errors) and str(getattr(error, "code", "") or "").startswith("23")
+
+# 與 Supabase 相同 ISO 8601 格式的 UTC 時間（字串可直接比較先後）
+SQLITE_NOW = "strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')"
+
+SQLITE_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS customers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    customer_name TEXT,
+    phone TEXT,
+    email TEXT,
+    agent_id TEXT,
+    office TEXT,
+    client_key TEXT UNIQUE,
+    updated_at TEXT NOT NULL DEFAULT ({SQLITE_NOW})
+);
+CREATE INDEX IF NOT EXISTS customers_agent_id_idx ON customers (agent_id, id DESC);
+CREATE INDEX IF NOT EXISTS customers_office_idx ON customers (office, id DESC);
+CREATE INDEX IF NOT EXISTS customers_updated_at_idx ON customers (updated_at, id);
+CREATE TRIGGER IF NOT EXISTS customers_set_updated_at AFTER UPDATE ON customers
+WHEN NEW.updated_at = OLD.updated_at
+BEGIN
+    UPDATE customers SET updated_at = {SQLITE_NOW} WHERE id = NEW.id;
+END;
+
+CREATE TABLE IF NOT EXISTS contact_logs (
+    contact_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    id INTEGER NOT NULL REFERENCES customers (id) ON DELETE CASCADE,
+    note TEXT,
+    agent_id TEXT,
+    contact_date TEXT NOT NULL DEFAULT ({SQLITE_NOW}),
+    client_key TEXT UNIQUE
+);
+CREATE INDEX IF NOT EXISTS contact_logs_customer_date_idx ON contact_logs (id, contact_date DESC, contact_id DESC);
+CREATE INDEX IF NOT EXISTS contact_logs_agent_date_idx ON contact_logs (agent_id, contact_date DESC);
+CREATE INDEX IF NOT EXISTS contact_logs_agent_contact_idx ON contact_logs (agent_id, contact_id);
+
+-- 沒有擁有者的客戶以最近一筆聯絡紀錄的業務回填（同 supabase_indexes.sql），否則任何業務都看不到
+UPDATE customers SET agent_id = (
+    SELECT agent_id FROM contact_logs
+    WHERE contact_logs.id = customers.id AND agent_id IS NOT NULL
+    ORDER BY contact_date DESC, contact_id DESC LIMIT 1
+)
+WHERE agent_id IS NULL;
+"""
+
+SQLITE_DUPLICATE_INDEXES = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS customers_phone_key_idx ON customers (normalize_phone(phone))",
+    "CREATE UNIQUE INDEX IF NOT EXISTS customers_email_key_idx ON customers (normalize_email(email))",
+]
+
+class SQLiteRepository(CustomerRepository):
+    """以本機 SQLite 檔案為資料來源（離線展示與效能測試用）
+
+    使用 WAL 模式讓讀取不被寫入阻擋；所有查詢皆為參數化語句，由連線的語句快取重複使用已編譯的語句。
+    """
+
+    CUSTOMER_COLUMNS = ("id", "customer_name", "phone", "email", "agent_id", "office", "client_key", "updated_at")
+    CONTACT_LOG_COLUMNS = ("contact_id", "id", "note", "agent_id", "contact_date", "client_key")
+    TABLE_COLUMNS = {"customers": CUSTOMER_COLUMNS, "contact_logs": CONTACT_LOG_COLUMNS}
+    errors = (sqlite3.Error,)
+
+    def __init__(self, path, timeout=5.0):
+        self.path = str(path)
+        self._conn = sqlite3.connect(
+            self.path, timeout=timeout, isolation_level=None,
+            check_same_thread=False, cached_statements=256,
+        )
+        self._conn.row_factory = sqlite3.Row
+        # 同一連線由多個 session／背景執行緒共用，以鎖串行化
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            # 與資料庫端相同的正規化函式，供電話 / Email 唯一索引使用
+            self._conn.create_function("normalize_phone", 1, lambda value: normalize_phone(value) or None, deterministic=True)
+            self._conn.create_function("normalize_email", 1, lambda value: normalize_email(value) or None, deterministic=True)
+            self._conn.executescript(SQLITE_SCHEMA)
+            for statement in SQLITE_DUPLICATE_INDEXES:
+                try:
+                    self._conn.execute(statement)
+                except sqlite3.IntegrityError as e:
+                    # 既有資料已有重複時無法建立，需先合併重複客戶
+                    print("Duplicate index error:", e)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _rows(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount
+
+    @staticmethod
+    def _checked(columns, allowed):
+        """欄位名稱無法參數化，只接受資料表內的欄位"""
+        unknown = [column for column in columns if column not in allowed]
+        if unknown:
+            raise ValueError(f"未知的欄位：{', '.join(unknown)}")
+        return list(columns)
+
+    def _where(self, scope, allowed, clauses=(), params=()):
+        clauses, params = list(clauses), list(params)
+        for column in self._checked(scope or {}, allowed):
+            clauses.append(f"{column} = ?")
+            params.append(scope[column])
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def _set(self, updates, allowed):
+        columns = self._checked(updates, allowed)
+        return ", ".join(f"{column} = ?" for column in columns), [updates[column] for column in columns]
+
+    def fetch_customers(self, scope=None):
+        where, params = self._where(scope, self.CUSTOMER_COLUMNS)
+        return self._rows(f"SELECT * FROM customers{where} ORDER BY id DESC", params)
+
+    def fetch_customers_page(self, after_id=None, limit=200, columns=None, scope=None, min_id=None):
+        select = ", ".join(self._checked(columns, self.CUSTOMER_COLUMNS)) if columns else "*"
+        clauses, params = [], []
+        if after_id is not None:
+            clauses.append("id < ?")
+            params.append(after_id)
+        if min_id is not None:
+            clauses.append("id >= ?")
+            params.append(min_id)
+        where, params = self._where(scope, self.CUSTOMER_COLUMNS, clauses, params)
+        sql = f"SELECT {select} FROM customers{where} ORDER BY id DESC"
+        if min_id is None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self._rows(sql, params)
+
+    def search_customers(self, query, limit=50, scope=None):
+        # LIKE 對 ASCII 不分大小寫，與 ilike 相同；跳脫 LIKE 的萬用字元
+        pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        condition = "(" + " OR ".join(f"{column} LIKE ? ESCAPE '\\'" for column in CUSTOMER_SEARCH_COLUMNS) + ")"
+        where, params = self._where(scope, self.CUSTOMER_COLUMNS, [condition], [pattern] * len(CUSTOMER_SEARCH_COLUMNS))
+        select = ", ".join(CUSTOMER_GRID_COLUMNS)
+        return self._rows(f"SELECT {select} FROM customers{where} ORDER BY id DESC LIMIT ?", params + [limit])
+
+    def fetch_latest_customer_update(self, scope=None):
+        where, params = self._where(scope, self.CUSTOMER_COLUMNS)
+        rows = self._rows(f"SELECT updated_at FROM customers{where} ORDER BY updated_at DESC LIMIT 1", params)
+        return rows[0]["updated_at"] if rows else None
+
+    def fetch_customers_changed_since(self, since, scope=None, batch_size=500):
+        select = ", ".join(CUSTOMER_SYNC_COLUMNS)
+        changed = []
+        last_id = None
+        while True:
+            if since is None:
+                clauses, params = [], []
+            elif last_id is None:
+                clauses, params = ["updated_at > ?"], [since]
+            else:
+                clauses, params = ["(updated_at, id) > (?, ?)"], [since, last_id]
+            where, params = self._where(scope, self.CUSTOMER_COLUMNS, clauses, params)
+            rows = self._rows(f"SELECT {select} FROM customers{where} ORDER BY updated_at, id LIMIT ?", params + [batch_size])
+            changed.extend(rows)
+            if len(rows) < batch_size:
+                return changed
+            since, last_id = rows[-1]["updated_at"], rows[-1]["id"]
+
+    def _insert(self, table, row, allowed):
+        columns = self._checked(row, allowed)
+        placeholders = ", ".join("?" for _ in columns)
+        rows = self._rows(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders}) RETURNING *",
+            [row[column] for column in columns],
+        )
+        return rows[0] if rows else None
+
+    def create_customer(self, customer):
+        return self._insert("customers", customer, self.CUSTOMER_COLUMNS)
+
+    def upsert_customers(self, customers):
+        if not customers:
+            return []
+        columns = self._checked(customers[0], self.CUSTOMER_COLUMNS)
+        # 不指定衝突欄位：client_key、電話、Email 任一唯一索引衝突都略過
+        sql = (
+            f"INSERT INTO customers ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+            " ON CONFLICT DO NOTHING RETURNING *"
+        )
+        inserted = []
+        # 整批在同一個交易內寫入，逐列重複使用同一個已編譯語句
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for customer in customers:
+                    row = self._conn.execute(sql, [customer.get(column) for column in columns]).fetchone()
+                    if row is not None:
+                        inserted.append(dict(row))
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return inserted
+
+    def update_customer(self, customer_id, updates):
+        assignments, params = self._set(updates, self.CUSTOMER_COLUMNS)
+        return self._execute(f"UPDATE customers SET {assignments} WHERE id = ?", params + [customer_id]) > 0
+
+    def delete_customer(self, customer_id):
+        return self._execute("DELETE FROM customers WHERE id = ?", (customer_id,)) > 0
+
+    def fetch_contact_logs(self, customer_id, scope=None):
+        where, params = self._where(scope, self.CONTACT_LOG_COLUMNS, ["id = ?"], [customer_id])
+        return self._rows(f"SELECT * FROM contact_logs{where} ORDER BY contact_date DESC, contact_id DESC", params)
+
+    def fetch_contact_logs_page(self, customer_id, before=None, limit=20, scope=None):
+        clauses, params = ["id = ?"], [customer_id]
+        if before is not None:
+            clauses.append("(contact_date, contact_id) < (?, ?)")
+            params.extend(before)
+        where, params = self._where(scope, self.CONTACT_LOG_COLUMNS, clauses, params)
+        sql = f"SELECT * FROM contact_logs{where} ORDER BY contact_date DESC, contact_id DESC LIMIT ?"
+        return self._rows(sql, params + [limit])
+
+    def fetch_contact_logs_batch(self, customer_ids, per_customer=None, scope=None):
+        # 客戶 id 以 JSON 陣列傳入，不論筆數都是同一個語句
+        clauses, params = ["id IN (SELECT value FROM json_each(?))"], [json.dumps(list(customer_ids))]
+        where, params = self._where(scope, self.CONTACT_LOG_COLUMNS, clauses, params)
+        if not per_customer:
+            return self._rows(f"SELECT * FROM contact_logs{where} ORDER BY contact_date DESC, contact_id DESC", params)
+        rows = self._rows(
+            "SELECT * FROM ("
+            " SELECT *, ROW_NUMBER() OVER (PARTITION BY id ORDER BY contact_date DESC, contact_id DESC) AS rank"
+            f" FROM contact_logs{where}"
+            ") WHERE rank <= ? ORDER BY contact_date DESC, contact_id DESC",
+            params + [per_customer],
+        )
+        for row in rows:
+            del row["rank"]
+        return rows
+
+    def create_contact_log(self, log):
+        return self._insert("contact_logs", log, self.CONTACT_LOG_COLUMNS)
+
+    def update_contact_log(self, log_id, updates):
+        assignments, params = self._set(updates, self.CONTACT_LOG_COLUMNS)
+        return self._execute(f"UPDATE contact_logs SET {assignments} WHERE contact_id = ?", params + [log_id]) > 0
+
+    def delete_contact_log(self, log_id):
+        return self._execute("DELETE FROM contact_logs WHERE contact_id = ?", (log_id,)) > 0
+
+    def fetch_export_page(self, table, after=None, limit=1000, filters=None):
+        key, date_column = EXPORT_TABLES[table]
+        filters = filters or {}
+        source, clauses, params = table, [], []
+        if filters.get("office"):
+            if table == "contact_logs":
+                source = "contact_logs JOIN customers ON customers.id = contact_logs.id"
+            clauses.append("customers.office = ?")
+            params.append(filters["office"])
+        if filters.get("agent_id"):
+            clauses.append(f"{table}.agent_id = ?")
+            params.append(filters["agent_id"])
+        if filters.get("date_from"):
+            clauses.append(f"{table}.{date_column} >= ?")
+            params.append(filters["date_from"])
+        if filters.get("date_to"):
+            clauses.append(f"{table}.{date_column} < ?")
+            params.append(filters["date_to"])
+        if after is not None:
+            clauses.append(f"{table}.{key} > ?")
+            params.append(after)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        return self._rows(f"SELECT {table}.* FROM {source}{where} ORDER BY {table}.{key} LIMIT ?", params + [limit])
+
+    def insert_rows(self, table, rows):
+        allowed = self.TABLE_COLUMNS[table]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for row in rows:
+                    columns = self._checked(row, allowed)
+                    self._conn.execute(
+                        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+                        " ON CONFLICT (client_key) DO NOTHING",
+                        [row[column] for column in columns],
+                    )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def update_rows(self, table, key_column, keys, updates):
+        allowed = self.TABLE_COLUMNS[table]
+        assignments, params = self._set(updates, allowed)
+        key_column, = self._checked([key_column], allowed)
+        self._execute(
+            f"UPDATE {table} SET {assignments} WHERE {key_column} IN (SELECT value FROM json_each(?))",
+            params + [json.dumps(list(keys))],
+        )
+
+    def is_conflict(self, error):
+        return isinstance(error, sqlite3.IntegrityError)
+
+SQLITE_PATH = Path(__file__).with_name("green_garden.db")
+
+@st.cache_resource
+def get_repository():
+    """程序共用的資料來源：設定 data_backend=sqlite 時使用本機 SQLite 檔案（sqlite_path），預設為 Supabase"""
+    if get_setting("data_backend", "supabase") == "sqlite":
+        return SQLiteRepository(get_setting("sqlite_path", SQLITE_PATH))
+    return SupabaseRepository(
+        get_supabase(),
+        use_rpc=get_flag("contact_log_rpc"),
+        max_rows=int(get_setting("supabase_max_rows", 1000)),
+    )
 
 # ---------- Customers CRUD ----------
-def fetch_customers():
-    supabase = get_supabase()
-    resp = supabase.table("customers").select("*").order("id", desc=True).execute()
-    # 如果資料抓取成功 resp.data 會是一個 list
-    if resp.data is None:
+def fetch_customers(scope=None):
+    data = get_repository().fetch_customers(scope)
+    # 如果資料抓取成功 data 會是一個 list
+    if data is None:
         st.error("無法取得客戶資料")
         return []
-    return resp.data   
+    return data
 
-def create_customer(customer_name, phone, email):
-    supabase = get_supabase()
+def create_customer(customer_name, phone, email, agent_id=None, office=None):
+    # 新增前先以記憶體索引檢查重複，電話或 Email 已有客戶時拋出 DuplicateCustomerError
+    duplicate = find_duplicate_customer(phone, email)
+    if duplicate:
+        raise DuplicateCustomerError(*duplicate)
     customer = {"customer_name": customer_name,"phone": phone,"email": email}
+    # 記錄負責業務與營業處，查詢時才能依範圍篩選
+    if agent_id:
+        customer["agent_id"] = agent_id
+    if office:
+        customer["office"] = office
+    if write_behind_enabled():
+        # 放入延後寫入佇列，回傳尚未有 id 的客戶資料；先以 client_key 佔用電話 / Email，
+        # 背景寫入前重複新增同一位客戶也會被擋下（寫入後由索引更新換成實際 id）
+        customer["client_key"] = get_write_queue().enqueue_insert("customers", customer, owner=agent_id)
+        get_duplicate_index().patch(customer["client_key"], phone=phone, email=email)
+        return customer
     try:
-        resp = supabase.table("customers").insert(customer).execute()
-
-        # resp.data 是 list，如果成功插入會有資料
-        if resp.data and len(resp.data) > 0:
-            return resp.data[0]
-        else:
-            return None
-
+        created = get_repository().create_customer(customer)
     except Exception as e:
         print("Insert error:", e)
         return None
+    if created:
+        get_duplicate_index().patch(created["id"], phone=created.get("phone"), email=created.get("email"))
+    return created
 
 def update_customer(customer_id, updates):
-    supabase = get_supabase()
-    resp = supabase.table("customers").update(updates).eq("id", customer_id).execute()
-    st.write("Supabase 回傳:", resp)
-    
-    # resp 是字典
-    # 成功判斷：data 有值且 count > 0
-    if resp.data and len(resp.data) > 0:
-        return True
-    return False
+    repository = get_repository()
+    try:
+        updated = repository.update_customer(customer_id, updates)
+    except repository.errors as e:
+        print("Update error:", e)
+        return False
+    if updated:
+        patch_duplicate_index(customer_id, updates)
+    return updated
 
 def delete_customer(customer_id):
-    supabase = get_supabase()
-    resp = supabase.table("customers").delete().eq("id", customer_id).execute()
-    return resp.status_code == 200
+    deleted = get_repository().delete_customer(customer_id)
+    if deleted:
+        get_duplicate_index().remove(customer_id)
+    return deleted
+
+def patch_duplicate_index(customer_id, updates):
+    """客戶的電話 / Email 修改後同步更新重複檢查索引"""
+    fields = {field: updates[field] for field in ("phone", "email") if field in updates}
+    if fields:
+        get_duplicate_index().patch(customer_id, **fields)
+
+# ---------- Customers paging ----------
+# 客戶列表只需要這些欄位（依表格顯示順序）
+CUSTOMER_GRID_COLUMNS = ["customer_name", "phone", "email", "id"]
+
+def fetch_customers_page(after_id=None, limit=200, columns=CUSTOMER_GRID_COLUMNS, scope=None, min_id=None):
+    """以 id 做 keyset 分頁取得一頁客戶（id 由大到小，after_id 為上一頁最後一筆的 id）
+
+    指定 min_id 時改為取回 id 介於 [min_id, after_id) 的所有客戶（重新載入邊界已知的頁面）。
+    """
+    data = get_repository().fetch_customers_page(after_id, limit, columns, scope, min_id)
+    if data is None:
+        st.error("無法取得客戶資料")
+        return []
+    return data
+
+class CustomerPager:
+    """客戶資料的分頁來源：依需要才載入頁面，session 內只保留最近使用的數頁"""
+
+    def __init__(self, page_size=200, max_cached_pages=5, scope=None):
+        self.scope = scope
+        self.page_size = page_size
+        self.max_cached_pages = max_cached_pages
+        self.pages = OrderedDict()
+        # cursors[n] 為第 n 頁的起點（上一頁最後一筆 id），第 0 頁從頭開始
+        self.cursors = [None]
+
+    def has_next(self, page_no):
+        return page_no + 1 < len(self.cursors)
+
+    def seed_first_page(self, rows):
+        """放入事先（例如啟動時並行）取得的第一頁資料"""
+        if self.pages:
+            return
+        if len(rows) == self.page_size:
+            self.cursors.append(rows[-1]["id"])
+        self.pages[0] = rows
+
+    def get_page(self, page_no):
+        """取得第 page_no 頁（從 0 起算）；快取中有則不查詢資料庫"""
+        if page_no in self.pages:
+            self.pages.move_to_end(page_no)
+            return self.pages[page_no]
+        if page_no >= len(self.cursors):
+            return []
+
+        if self.has_next(page_no):
+            # 頁面邊界已知（曾載入後被移出快取）：依原邊界重新載入，避免新增資料造成漏列或重複
+            rows = fetch_customers_page(self.cursors[page_no], scope=self.scope, min_id=self.cursors[page_no + 1])
+        else:
+            rows = fetch_customers_page(self.cursors[page_no], self.page_size, scope=self.scope)
+            # 整頁都有資料才可能還有下一頁
+            if len(rows) == self.page_size:
+                self.cursors.append(rows[-1]["id"])
+
+        self.pages[page_no] = rows
+        while len(self.pages) > self.max_cached_pages:
+            self.pages.popitem(last=False)
+        return rows
+
+    def apply_changes(self, rows):
+        """套用同步取回的變更：已載入的客戶就地更新，新客戶加到第一頁最前面；回傳是否有新增"""
+        loaded = {row["id"]: row for page in self.pages.values() for row in page}
+        first_page = self.pages.get(0)
+        newest_id = first_page[0]["id"] if first_page else None
+        new_rows = []
+        for row in rows:
+            if row["id"] in loaded:
+                loaded[row["id"]].update(row)
+            elif first_page is not None and (newest_id is None or row["id"] > newest_id):
+                new_rows.append(row)
+        if new_rows:
+            first_page[:0] = sorted(new_rows, key=lambda row: row["id"], reverse=True)
+        return bool(new_rows)
+
+    def invalidate(self):
+        """清除所有已載入頁面（新增或刪除客戶後頁面邊界會改變）"""
+        self.pages.clear()
+        self.cursors = [None]
+
+    def reload_pages(self):
+        """清除已載入的頁面但保留頁面邊界，之後依原邊界重新載入（其他人刪除或移出範圍的客戶會消失）"""
+        self.pages.clear()
+
+# ---------- Customers sync ----------
+CUSTOMER_SYNC_COLUMNS = CUSTOMER_GRID_COLUMNS + ["updated_at"]
+
+def fetch_latest_customer_update(scope=None):
+    """範圍內最新一筆 updated_at，作為同步的起始高水位"""
+    return get_repository().fetch_latest_customer_update(scope)
+
+def fetch_customers_changed_since(since, scope=None, batch_size=500):
+    """取得 updated_at 晚於 since 的客戶，依 (updated_at, id) 排序分批取回"""
+    return get_repository().fetch_customers_changed_since(since, scope, batch_size)
+
+class CustomerSync:
+    """增量同步：記錄本 session 已看過的 updated_at 高水位，之後只取回有變更的客戶
+
+    高水位只看得到新增與修改；被刪除或移到其他營業處的客戶要等每 reconcile_seconds 一次的
+    重新載入（reconcile_due）才會從畫面上消失。
+    """
+
+    def __init__(self, scope=None, interval_seconds=30, mark=None, reconcile_seconds=300):
+        self.scope = scope
+        self.interval_seconds = interval_seconds
+        self.reconcile_seconds = reconcile_seconds
+        self.mark = mark if mark is not None else fetch_latest_customer_update(scope)
+        self.synced_at = self.reconciled_at = time.monotonic()
+        self.stats = {"pulls": 0, "rows": 0, "reconciles": 0}
+
+    def due(self):
+        return time.monotonic() - self.synced_at >= self.interval_seconds
+
+    def reconcile_due(self):
+        return bool(self.reconcile_seconds) and time.monotonic() - self.reconciled_at >= self.reconcile_seconds
+
+    def mark_reconciled(self):
+        self.reconciled_at = time.monotonic()
+        self.stats["reconciles"] += 1
+
+    def pull(self):
+        """取回高水位之後變更的客戶並推進高水位"""
+        rows = fetch_customers_changed_since(self.mark, scope=self.scope)
+        if rows:
+            self.mark = rows[-1]["updated_at"]
+        self.synced_at = time.monotonic()
+        self.stats["pulls"] += 1
+        self.stats["rows"] += len(rows)
+        return rows
+
+# ---------- Customers search ----------
+CUSTOMER_SEARCH_COLUMNS = ["customer_name", "phone", "email"]
+CUSTOMER_SEARCH_MIN_CHARS = 2
+
+def normalize_search_query(query):
+    """整理搜尋字串：去除 PostgREST 篩選語法的保留字元並合併空白"""
+    query = "".join(ch for ch in str(query or "") if ch not in ',()*%"\\')
+    return " ".join(query.split())
+
+def search_customers(query, limit=50, scope=None):
+    """在資料庫端以 ilike 搜尋姓名、電話、Email（搭配 pg_trgm 索引，見 supabase_indexes.sql）"""
+    data = get_repository().search_customers(query, limit, scope)
+    if data is None:
+        st.error("無法搜尋客戶資料")
+        return []
+    return data
+
+def get_customer_search_results(query, scope=None):
+    """搜尋客戶，session 內暫存最近的查詢結果"""
+    if "customer_search_cache" not in st.session_state:
+        st.session_state.customer_search_cache = LRUCache(
+            maxsize=int(get_setting("customer_search_cache_size", 20)),
+            ttl_seconds=float(get_setting("customer_search_cache_ttl", 60)),
+        )
+    cache = st.session_state.customer_search_cache
+    key = (query.lower(), tuple(sorted((scope or {}).items())))
+    rows = cache.get(key)
+    if rows is None:
+        rows = search_customers(query, limit=int(get_setting("customer_search_limit", 50)), scope=scope)
+        cache.set(key, rows)
+    return rows
 
 # ---------- Contact logs ----------
-def fetch_contact_logs(customer_id):
-    supabase = get_supabase()
-    resp = supabase.table("contact_logs").select("*").eq("id", customer_id).order("contact_date", desc=True).execute()
-    return resp.data if resp.status_code == 200 else []
+# supabase-py 2.x 的回應沒有 status_code，失敗時會拋出 APIError，因此以 resp.data 判斷結果
+def fetch_contact_logs(customer_id, scope=None):
+    return get_repository().fetch_contact_logs(customer_id, scope)
+
+def fetch_contact_logs_page(customer_id, before=None, limit=20, scope=None):
+    """依 contact_date 由新到舊分頁取得聯絡紀錄（同日期再依 contact_id），before 為上一頁最後一筆的 (contact_date, contact_id)"""
+    return get_repository().fetch_contact_logs_page(customer_id, before, limit, scope)
+
+def fetch_contact_logs_batch(customer_ids, per_customer=None, scope=None):
+    """一次查詢多位客戶的聯絡紀錄，回傳 {客戶id: [紀錄]}（由新到舊）
+
+    設定 contact_log_rpc 時改呼叫 latest_contact_logs RPC（見 supabase_indexes.sql），
+    資料庫端即只回傳每位客戶最新 per_customer 筆；否則以 in_() 查詢取回最新的
+    客戶數 × per_customer 筆，少數客戶紀錄特別多而佔滿上限時，其餘客戶再各自補查。
+    資料來源有單次回傳上限（max_rows）時，客戶分批查詢，讓每批最多 max_rows 筆。
+    """
+    customer_ids = list(customer_ids)
+    repository = get_repository()
+    chunk_size = len(customer_ids) or 1
+    if per_customer and repository.max_rows:
+        chunk_size = max(repository.max_rows // per_customer, 1)
+
+    grouped = {customer_id: [] for customer_id in customer_ids}
+    for start in range(0, len(customer_ids), chunk_size):
+        chunk = customer_ids[start:start + chunk_size]
+        rows = repository.fetch_contact_logs_batch(chunk, per_customer, scope)
+        for row in rows:
+            logs = grouped.setdefault(row["id"], [])
+            if not per_customer or len(logs) < per_customer:
+                logs.append(row)
+        capped = repository.max_rows and len(rows) >= repository.max_rows
+        if per_customer and (len(rows) >= len(chunk) * per_customer or capped):
+            # 結果被筆數上限截斷：不足 per_customer 筆的客戶可能還有較舊的紀錄沒取到
+            for customer_id in chunk:
+                if len(grouped[customer_id]) < per_customer:
+                    grouped[customer_id] = repository.fetch_contact_logs_page(customer_id, None, per_customer, scope)
+    return grouped
 
 def create_contact_log(customer_id, note, created_by):
-    supabase = get_supabase()
-    payload = {"id": customer_id, "note": note, "agent_id": created_by}
-    resp = supabase.table("contact_logs").insert(payload).execute()
-    return resp.data[0] if resp.status_code == 201 or resp.status_code == 200 else None
+    log = {"id": customer_id, "note": note, "agent_id": created_by}
+    if write_behind_enabled():
+        # 延後寫入時回傳尚未有 contact_id 的紀錄（含 client_key）
+        log["client_key"] = get_write_queue().enqueue_insert("contact_logs", log, owner=created_by)
+    else:
+        log = get_repository().create_contact_log(log)
+    invalidate_contact_logs(customer_id=customer_id)
+    return log
 
 def update_contact_log(log_id, updates):
-    supabase = get_supabase()
-    resp = supabase.table("contact_logs").update(updates).eq("contact_id", log_id).execute()
-    return resp.status_code == 200
+    if write_behind_enabled():
+        get_write_queue().enqueue_update("contact_logs", "contact_id", log_id, updates, owner=st.session_state.get("agent_id"))
+        updated = True
+    else:
+        updated = get_repository().update_contact_log(log_id, updates)
+    invalidate_contact_logs(log_id=log_id)
+    return updated
 
 def delete_contact_log(log_id):
-    supabase = get_supabase()
-    resp = supabase.table("contact_logs").delete().eq("contact_id", log_id).execute()
-    return resp.status_code == 200
+    deleted = get_repository().delete_contact_log(log_id)
+    invalidate_contact_logs(log_id=log_id)
+    return deleted
+
+class ContactLogLoader:
+    """聯絡紀錄載入器：多位客戶合併為一次查詢，結果以客戶為單位存入 LRU 快取
+
+    每位客戶的紀錄依 contact_date 由新到舊，時間軸需要更多筆時才往下載入下一頁。
+    """
+
+    def __init__(self, scope=None, page_size=20, maxsize=200, ttl_seconds=60):
+        self.scope = scope
+        self.page_size = page_size
+        self.cache = LRUCache(maxsize=maxsize, ttl_seconds=ttl_seconds, on_evict=self._forget)
+        # contact_id -> 客戶id，供修改/刪除單筆紀錄時找到要失效的客戶（只記錄快取中的客戶）
+        self._owners = {}
+        # 快取內容變更（載入或失效）時遞增，供顯示端判斷是否需要重建
+        self.version = 0
+
+    def _store(self, customer_id, logs, complete):
+        self.version += 1
+        self.cache.set(customer_id, {"logs": logs, "complete": complete})
+        for log in logs:
+            self._owners[log.get("contact_id")] = customer_id
+
+    def _forget(self, customer_id, entry):
+        """客戶移出快取時一併移除其紀錄的對應"""
+        for log in entry["logs"]:
+            if self._owners.get(log.get("contact_id")) == customer_id:
+                del self._owners[log.get("contact_id")]
+
+    def latest(self, customer_ids, limit=1):
+        """取得多位客戶最新 limit 筆紀錄；快取未命中的客戶合併為一次查詢"""
+        result, missing = {}, []
+        for customer_id in customer_ids:
+            entry = self.cache.get(customer_id)
+            if entry is not None and (entry["complete"] or len(entry["logs"]) >= limit):
+                result[customer_id] = entry["logs"][:limit]
+            else:
+                missing.append(customer_id)
+
+        if missing:
+            # RPC 一次取回一頁供時間軸沿用；in_() 查詢只取需要的筆數，避免取回完整歷史
+            per_customer = max(self.page_size, limit) if get_flag("contact_log_rpc") else limit
+            for customer_id, logs in fetch_contact_logs_batch(missing, per_customer, scope=self.scope).items():
+                complete = per_customer is None or len(logs) < per_customer
+                self._store(customer_id, logs, complete)
+                result[customer_id] = logs[:limit]
+        return result
+
+    def timeline(self, customer_id, count):
+        """取得某位客戶由新到舊的前 count 筆紀錄，回傳 (紀錄, 是否還有更多)"""
+        entry = self.cache.get(customer_id) or {"logs": [], "complete": False}
+        logs, complete = entry["logs"], entry["complete"]
+        while len(logs) < count and not complete:
+            before = (logs[-1]["contact_date"], logs[-1]["contact_id"]) if logs else None
+            page = fetch_contact_logs_page(customer_id, before, self.page_size, scope=self.scope)
+            logs = logs + page
+            complete = len(page) < self.page_size
+        self._store(customer_id, logs, complete)
+        return logs[:count], len(logs) > count or not complete
+
+    def invalidate(self, customer_id=None, log_id=None):
+        self.version += 1
+        if customer_id is None:
+            customer_id = self._owners.pop(log_id, None)
+        if customer_id is not None:
+            entry = self.cache.pop(customer_id)
+            if entry is not None:
+                self._forget(customer_id, entry)
+        elif log_id is not None:
+            # 找不到所屬客戶時，保守起見清除全部
+            self.cache.clear()
+            self._owners.clear()
+
+def get_contact_log_loader():
+    """本 session 的聯絡紀錄載入器（資料範圍變更時重建）"""
+    scope = get_contact_log_scope()
+    loader = st.session_state.get("contact_log_loader")
+    if loader is None or loader.scope != scope:
+        loader = ContactLogLoader(
+            scope=scope,
+            page_size=int(get_setting("contact_log_page_size", 20)),
+            maxsize=int(get_setting("contact_log_cache_size", 200)),
+        )
+        st.session_state.contact_log_loader = loader
+    return loader
+
+def invalidate_contact_logs(customer_id=None, log_id=None):
+    """新增/修改/刪除聯絡紀錄後清除本 session 的快取（其他 session 由快取存活時間控制）"""
+    loader = st.session_state.get("contact_log_loader")
+    if loader is not None:
+        loader.invalidate(customer_id=customer_id, log_id=log_id)
+
+# ---------- Write-behind queue ----------
+class WriteBehindQueue:
+    """延後寫入佇列：同一筆資料的多次修改先在記憶體合併，再由背景執行緒批次寫入
+
+    - 新增：每筆帶 client_key（冪等鍵），以 upsert(on_conflict=client_key, 忽略重複) 批次送出，重送不會產生重複資料
+    - 修改：同一筆的修改合併為一次，內容相同的多筆合併成一個 PATCH ... in (ids)
+    寫入成功後才移出佇列（at-least-once）；失敗會重試，超過 max_attempts 次後列為失敗，可手動重試。
+    佇列只存在記憶體中：程序正常結束時由 atexit 寫入剩下的資料，但程序當機、被強制終止（SIGKILL、
+    容器休眠）時尚未寫入的資料會遺失，at-least-once 只在程序持續執行或正常結束時成立。
+    """
+
+    def __init__(self, repository, flush_interval=2.0, max_batch=100, max_attempts=5):
+        self.repository = repository
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_attempts = max_attempts
+        self._pending = OrderedDict()
+        self._failed = OrderedDict()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._worker = None
+        self.stats = {"enqueued": 0, "coalesced": 0, "flushes": 0, "rows_written": 0, "requests": 0, "errors": 0}
+        self.last_error = None
+
+    # --- 加入佇列 ---
+    def enqueue_insert(self, table, row, owner=None):
+        """加入一筆新增，回傳冪等鍵 client_key"""
+        row = dict(row)
+        client_key = row.setdefault("client_key", uuid.uuid4().hex)
+        self._enqueue((table, "insert", client_key), {"kind": "insert", "table": table, "row": row}, owner)
+        return client_key
+
+    def enqueue_update(self, table, key_column, key, updates, owner=None):
+        """加入一筆修改；同一筆資料尚未寫入的修改會合併"""
+        self._enqueue(
+            (table, key_column, key),
+            {"kind": "update", "table": table, "key_column": key_column, "key": key, "updates": dict(updates)},
+            owner,
+        )
+
+    def _enqueue(self, op_key, op, owner):
+        with self._lock:
+            self.stats["enqueued"] += 1
+            existing = self._pending.get(op_key) or self._failed.pop(op_key, None)
+            if existing is not None and op["kind"] == "update":
+                self.stats["coalesced"] += 1
+                op["updates"] = {**existing["updates"], **op["updates"]}
+            op.update(owner=owner, attempts=0, error=None)
+            self._pending[op_key] = op
+            if len(self._pending) >= self.max_batch:
+                self._wake.set()
+
+    # --- 寫入 ---
+    def flush(self):
+        """立即寫入目前佇列中的所有資料，回傳成功寫入的筆數"""
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._pending.items())
+                self._pending.clear()
+            if not batch:
+                return 0
+            self.stats["flushes"] += 1
+
+            written = sum(self._write(group) for group in self._group(batch))
+            self.stats["rows_written"] += written
+            return written
+
+    def _write(self, group):
+        """寫入一組資料，回傳成功筆數
+
+        違反資料限制（例如電話重複、客戶已被刪除）時整組都不會寫入：改為逐筆重寫，
+        只有違反限制的那筆直接列為失敗（重送也不會成功），其餘照常寫入。
+        """
+        try:
+            self._send(group)
+            return len(group)
+        except Exception as e:
+            error = e
+        conflict = self.repository.is_conflict(error)
+        if conflict and len(group) > 1:
+            return sum(self._write([item]) for item in group)
+        self.stats["errors"] += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+        print("Write-behind flush error:", error)
+        self._requeue(group, self.last_error, permanent=conflict)
+        return 0
+
+    def _group(self, batch):
+        """新增依資料表分組；修改依（資料表, 鍵欄位, 修改內容）分組"""
+        groups = OrderedDict()
+        for op_key, op in batch:
+            if op["kind"] == "insert":
+                group_key = ("insert", op["table"])
+            else:
+                group_key = ("update", op["table"], op["key_column"], tuple(sorted(op["updates"].items(), key=lambda item: item[0])))
+            groups.setdefault(group_key, []).append((op_key, op))
+        return list(groups.values())
+
+    def _send(self, group):
+        first = group[0][1]
+        self.stats["requests"] += 1
+        if first["kind"] == "insert":
+            self.repository.insert_rows(first["table"], [op["row"] for _, op in group])
+        else:
+            keys = [op["key"] for _, op in group]
+            self.repository.update_rows(first["table"], first["key_column"], keys, first["updates"])
+
+    def _requeue(self, group, error, permanent=False):
+        """寫入失敗的資料放回佇列；permanent（違反資料限制）時不再自動重試，直接列為失敗"""
+        with self._lock:
+            for op_key, op in group:
+                op["attempts"] = self.max_attempts if permanent else op["attempts"] + 1
+                op["error"] = error
+                newer = self._pending.pop(op_key, None)
+                if newer is not None and op["kind"] == "update":
+                    # 寫入期間又有新的修改：以新的值為準
+                    op["updates"] = {**op["updates"], **newer["updates"]}
+                    op["attempts"] = 0
+                if op["attempts"] >= self.max_attempts:
+                    self._failed[op_key] = op
+                else:
+                    self._pending[op_key] = op
+
+    def retry_failed(self, owner=None):
+        """將失敗的資料重新放回佇列"""
+        with self._lock:
+            for op_key in [k for k, op in self._failed.items() if owner is None or op["owner"] == owner]:
+                op = self._failed.pop(op_key)
+                op["attempts"] = 0
+                self._pending.setdefault(op_key, op)
+        self._wake.set()
+
+    # --- 背景執行緒 ---
+    def start(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        self._stop_event.clear()
+        self._worker = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+        if self._worker is not None:
+            self._worker.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def status(self, owner=None):
+        """待寫入與失敗筆數（可只計算某位業務的資料）"""
+        with self._lock:
+            pending = [op for op in self._pending.values() if owner is None or op["owner"] == owner]
+            failed = [op for op in self._failed.values() if owner is None or op["owner"] == owner]
+        return {
+            "pending": len(pending),
+            "failed": len(failed),
+            "errors": [op["error"] for op in failed][-5:],
+        }
+
+@st.cache_resource
+def get_write_queue():
+    """程序共用的延後寫入佇列（設定 write_behind 時啟用）"""
+    queue = WriteBehindQueue(
+        get_repository(),
+        flush_interval=float(get_setting("write_behind_interval", 2)),
+        max_batch=int(get_setting("write_behind_batch_size", 100)),
+        max_attempts=int(get_setting("write_behind_max_attempts", 5)),
+    )
+    queue.start()
+    # 程序正常結束（包含 Streamlit 收到 SIGTERM）時先寫入佇列中剩下的資料
+    atexit.register(queue.stop)
+    return queue
+
+def write_behind_enabled():
+    """延後寫入只用於 Supabase；本機 SQLite 直接寫入即可"""
+    return get_flag("write_behind") and get_setting("data_backend", "supabase") != "sqlite"
+
+
 
 
+ROSTER_URL = "https://raw.githubusercontent.com/m9606286/green-garden-app/main/my_app/在職業務名單.xlsx"
+ROSTER_SNAPSHOT_PATH = Path(__file__).with_name(".roster_snapshot.pkl")
+ROSTER_SNAPSHOT_VERSION = 1
 
+ROSTER_COLUMNS = ['業務身份證字號', '業務姓名', '營業處']
+
+def build_agent_index(df):
+    """以欄位向量化運算建立 {身份證字號: 業務資料} 索引
+
+    去除前後空白、身份證字號轉大寫，並排除空白與重複的身份證字號（重複時以最後一筆為準）。
+    """
+    agent_ids = df['業務身份證字號'].astype('string').str.strip().str.upper()
+    names = df['業務姓名'].astype('string').str.strip().fillna('')
+    offices = df['營業處'].astype('string').str.strip().fillna('')
+
+    valid = agent_ids.notna() & (agent_ids != '')
+    keep = valid & ~agent_ids.duplicated(keep='last')
+
+    return {
+        agent_id: {'name': name, 'office': office, 'status': 'active'}
+        for agent_id, name, office in zip(
+            agent_ids[keep].tolist(), names[keep].tolist(), offices[keep].tolist()
+        )
+    }
+
+def parse_authorized_agents(content):
+    """將業務名單Excel內容轉換為 {身份證字號: 業務資料} 字典"""
+    import pandas as pd
+
+    # 只讀取需要的欄位，並以字串讀入避免型別推斷
+    df = pd.read_excel(io.BytesIO(content), usecols=ROSTER_COLUMNS, dtype=str)
+    return build_agent_index(df)
+
+def write_file_atomic(path, data):
+    """先寫入同目錄的暫存檔再以 os.replace 取代，避免讀到寫到一半的檔案"""
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class RosterCache:
+    """程序層級的業務名單快取，所有 session 共用同一份名單
+
+    TTL 內直接回傳快取；逾時後以 ETag / If-Modified-Since 發出條件式請求，
+    檔案未變更時 GitHub 回傳 304，不需重新下載與解析。
+    解析結果另存為本機快照：冷啟動時直接載入，來源檔案的 checksum 變更時才重新解析，
+    無法連線至 GitHub 時也以快照作為備援。
+    啟動背景更新執行緒後，名單改由背景定期更新，新名單建好後才以參考替換發布，
+    各 session 的 verify_agent 不會被阻塞，也不會讀到建到一半的字典。
+    """
+
+    def __init__(self, excel_url, ttl_seconds=300, timeout=10, snapshot_path=None):
+        self.excel_url = excel_url
+        self.ttl_seconds = ttl_seconds
+        self.timeout = timeout
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else None
+        self.agents = None
+        self.etag = None
+        self.last_modified = None
+        self.checksum = None
+        self.checked_at = 0.0
+        self.stats = {"hits": 0, "misses": 0, "refreshes": 0, "not_modified": 0, "unchanged": 0,
+                      "errors": 0, "snapshot_loads": 0, "snapshot_writes": 0}
+        self.last_refresh_at = None
+        self.last_refresh_duration = None
+        self.last_error = None
+        self.last_error_at = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._refresher = None
+        self._load_snapshot()
+
+    def _load_snapshot(self):
+        """從本機快照載入名單（快照不存在、版本或來源不符時略過）"""
+        if not self.snapshot_path or not self.snapshot_path.exists():
+            return
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                snapshot = pickle.load(f)
+            if snapshot.get("version") != ROSTER_SNAPSHOT_VERSION or snapshot.get("source_url") != self.excel_url:
+                return
+        except Exception as e:
+            print("Roster snapshot load error:", e)
+            return
+
+        self.agents = snapshot["agents"]
+        self.etag = snapshot["etag"]
+        self.last_modified = snapshot["last_modified"]
+        self.checksum = snapshot["checksum"]
+        # 快照在 TTL 內仍視為新鮮，休眠喚醒後不必立即連線
+        age = max(time.time() - snapshot["saved_at"], 0)
+        self.checked_at = time.monotonic() - age
+        self.stats["snapshot_loads"] += 1
+
+    def _save_snapshot(self):
+        if not self.snapshot_path:
+            return
+        snapshot = {
+            "version": ROSTER_SNAPSHOT_VERSION,
+            "source_url": self.excel_url,
+            "checksum": self.checksum,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "saved_at": time.time(),
+            "agents": self.agents,
+        }
+        try:
+            write_file_atomic(self.snapshot_path, pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL))
+            self.stats["snapshot_writes"] += 1
+        except OSError as e:
+            print("Roster snapshot write error:", e)
+
+    def _is_fresh(self):
+        return self.agents is not None and time.monotonic() - self.checked_at < self.ttl_seconds
+
+    def is_background_refreshing(self):
+        return self._refresher is not None and self._refresher.is_alive()
+
+    def get(self):
+        """取得業務名單；TTL 內或已啟動背景更新時不會發出任何網路請求"""
+        agents = self.agents
+        if agents is not None and (self.is_background_refreshing() or self._is_fresh()):
+            self.stats["hits"] += 1
+            return agents
+
+        with self._lock:
+            # 等待鎖的期間可能已由其他 session 更新完成
+            if self._is_fresh():
+                self.stats["hits"] += 1
+                return self.agents
+            self.stats["misses"] += 1
+            self._refresh()
+        return self.agents
+
+    def refresh(self):
+        """立即向來源重新檢查名單（供背景執行緒呼叫）"""
+        with self._lock:
+            self._refresh()
+        return self.agents
+
+    def start_background_refresh(self, interval_seconds):
+        """啟動背景更新的 daemon 執行緒（已啟動時不重複建立）"""
+        if self.is_background_refreshing():
+            return
+        self._stop_event.clear()
+        self._refresher = threading.Thread(
+            target=self._refresh_loop, args=(interval_seconds,),
+            name="roster-refresher", daemon=True
+        )
+        self._refresher.start()
+
+    def stop_background_refresh(self):
+        self._stop_event.set()
+
+    def _refresh_loop(self, interval_seconds):
+        # 快照已過期（或尚無名單）時先立即更新一次
+        wait_seconds = interval_seconds if self._is_fresh() else 0
+        while not self._stop_event.wait(wait_seconds):
+            try:
+                self.refresh()
+            except Exception:
+                # 錯誤已記錄於 last_error，下一輪再重試
+                pass
+            wait_seconds = interval_seconds
+
+    def status(self):
+        """名單快取的更新狀態與計數器"""
+        return {
+            "background_refresh": self.is_background_refreshing(),
+            "agents": len(self.agents) if self.agents is not None else 0,
+            "last_refresh_at": self.last_refresh_at.strftime("%Y-%m-%d %H:%M:%S") if self.last_refresh_at else None,
+            "last_refresh_duration_ms": round(self.last_refresh_duration * 1000, 1) if self.last_refresh_duration is not None else None,
+            "last_error": self.last_error,
+            "last_error_at": self.last_error_at.strftime("%Y-%m-%d %H:%M:%S") if self.last_error_at else None,
+            **self.stats,
+        }
+
+    def _refresh(self):
+        started = time.perf_counter()
+        headers = {}
+        if self.agents is not None:
+            if self.etag:
+                headers["If-None-Match"] = self.etag
+            if self.last_modified:
+                headers["If-Modified-Since"] = self.last_modified
+
+        try:
+            import requests
+
+            response = requests.get(self.excel_url, headers=headers, timeout=self.timeout)
+            if response.status_code == 304:
+                self.stats["not_modified"] += 1
+            else:
+                response.raise_for_status()
+                checksum = hashlib.sha256(response.content).hexdigest()
+                if self.agents is not None and checksum == self.checksum:
+                    # 內容未變（例如伺服器未支援條件式請求），不需重新解析
+                    self.stats["unchanged"] += 1
+                else:
+                    self.agents = parse_authorized_agents(response.content)
+                    self.checksum = checksum
+                    self.stats["refreshes"] += 1
+                self.etag = response.headers.get("ETag")
+                self.last_modified = response.headers.get("Last-Modified")
+            self._save_snapshot()
+        except Exception as e:
+            self.stats["errors"] += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            self.last_error_at = datetime.now()
+            # 尚無任何名單（也沒有快照）時無法繼續登入流程，直接拋出
+            if self.agents is None:
+                raise
+            print("Roster refresh error:", e)
+        finally:
+            self.last_refresh_at = datetime.now()
+            self.last_refresh_duration = time.perf_counter() - started
+
+        self.checked_at = time.monotonic()
+
+@st.cache_resource
+def get_roster_cache(excel_url):
+    """每個伺服器程序只建立一份業務名單快取"""
+    ttl_seconds = float(get_setting("roster_ttl_seconds", 300))
+    snapshot_path = get_setting("roster_snapshot_path", ROSTER_SNAPSHOT_PATH)
+    roster_cache = RosterCache(excel_url, ttl_seconds=ttl_seconds, snapshot_path=snapshot_path)
+
+    # 背景更新間隔預設與 TTL 相同，設為 0 則維持於使用者 rerun 時更新
+    refresh_interval = float(get_setting("roster_refresh_interval", ttl_seconds))
+    if refresh_interval > 0:
+        roster_cache.start_background_refresh(refresh_interval)
+    return roster_cache
 
 class AuthorizationSystem:
     def __init__(self, excel_url=None):
         # 預設的Excel檔案URL（放在GitHub上）
-        self.excel_url = excel_url or "https://raw.githubusercontent.com/m9606286/green-garden-app/main/my_app/在職業務名單.xlsx"
+        self.excel_url = excel_url or ROSTER_URL
+        self.roster_cache = get_roster_cache(self.excel_url)
         self.authorized_agents = self.load_authorized_agents()
     
     def load_authorized_agents(self):
-        """從Git上的Excel檔案載入授權的業務員資料"""
-        # 下載Excel檔案
-        response = requests.get(self.excel_url)
-        response.raise_for_status()
-            
-        # 讀取Excel檔案
-        df = pd.read_excel(io.BytesIO(response.content))
-            
-        # 直接處理資料，不檢查欄位
-        authorized_dict = {}
-        for _, row in df.iterrows():
-            agent_id = str(row['業務身份證字號']).strip().upper()
-            agent_name = str(row['業務姓名']).strip()
-            office = str(row['營業處']).strip()
-            
-            authorized_dict[agent_id] = {
-                'name': agent_name,
-                'office': office,
-                'status': 'active'
-            }
-        return authorized_dict
+        """從程序共用快取取得授權的業務員資料（必要時才向Git重新下載Excel）"""
+        return self.roster_cache.get()
     
     def verify_agent(self, agent_id):
         """驗證業務員身份證字號"""
@@ -234,7 +1661,7 @@ class AuthorizationSystem:
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
             try:
-                st.image("https://raw.githubusercontent.com/m9606286/green-garden-app/main/my_app/綠金園.png", width=100)
+                st.image(get_asset("綠金園.png"), width=100)
             except:
                 st.markdown("""
                 <div style="width: 100px; height: 100px; background: #2E8B57; border-radius: 10px; display: flex; align-items: center; justify-content: center; color: white; font-weight: bold; margin: 0 auto;">
@@ -286,308 +1713,736 @@ class AuthorizationSystem:
         st.markdown('</div>', unsafe_allow_html=True)
         st.stop()
 
-class GreenGardenProposal:
-    def __init__(self):
-        self.cemetery_products = self._init_cemetery_products()
-        self.memorial_products = self._init_memorial_products()
-        self.down_payments = self._init_down_payments()
-        self.management_down_payments = self._init_management_down_payments()
+def get_price_catalog(on_date=None):
+    """建議書日期適用的價格表（路徑可由 price_catalog_path 設定）"""
+    return load_price_catalog(on_date, get_setting("price_catalog_path", PRICE_CATALOG_PATH))
 
-    def _init_cemetery_products(self):
-        return {
-            "澤茵園": {
-                "單灰位": {"定價": 460000, "預購-現金價": 276000, "分期價": 292560, "馬上使用-現金價": 368000, "分期期數": 24, "管理費": 50200},
-                "貴族2灰": {"定價": 620000, "預購-現金價": 372000, "分期價": 394320, "馬上使用-現金價": 496000, "分期期數": 24, "管理費": 67700},
-                "家福4灰": {"定價": 950000, "預購-現金價": 570000, "分期價": 598500, "馬上使用-現金價": 760000, "分期期數": 24, "管理費": 103700},
-                "家族6灰": {"定價": 1300000, "預購-現金價": 780000, "分期價": 819000, "馬上使用-現金價": 1040000, "分期期數": 24, "管理費": 142000},
-                "聚賢閣壁龕12灰": {"定價": 3200000, "預購-現金價": 1888000, "分期價": 1982400, "馬上使用-現金價": 2560000, "分期期數": 42, "管理費": 349000},
-                "聚賢閣壁龕18灰": {"定價": 3800000, "預購-現金價": 2356000, "分期價": 2473800, "馬上使用-現金價": 3040000, "分期期數": 42, "管理費": 415000}
-            },
-         
-            "天璽文創園一期A區": {
-                "寶祥6灰": {"定價": 2200000, "預購-現金價": 1166000, "分期價": 1224300, "馬上使用-現金價": 1760000, "分期期數": 36, "管理費": 240000},
-                "寶祥9灰": {"定價": 3200000, "預購-現金價": 1696000, "分期價": 1780800, "馬上使用-現金價": 2560000, "分期期數": 42, "管理費": 350000},
-                "寶祥15灰": {"定價": 4000000, "預購-現金價": 2120000, "分期價": 2226000, "馬上使用-現金價": 3200000, "分期期數": 42, "管理費": 436400}
-            },
-            "天意園一期": {
-                "永念2灰": {"定價": 200000, "預購-現金價": 120000, "分期價": 128000, "馬上使用-現金價": 160000, "分期期數": 18, "管理費": 21900},
-                "永願2灰": {"定價": 420000, "預購-現金價": 252000, "分期價": 272160, "馬上使用-現金價": 336000, "分期期數": 24, "管理費": 45900},
-                "天地合和2灰": {"定價": 800000, "預購-現金價": 416000, "分期價": 440960, "馬上使用-現金價": 640000, "分期期數": 24, "管理費": 87300},
-                "天地圓融8灰": {"定價": 1800000, "預購-現金價": 936000, "分期價": 982800, "馬上使用-現金價": 1440000, "分期期數": 24, "管理費": 196400},
-                "天地福澤12灰": {"定價": 2800000, "預購-現金價": 1456000, "分期價": 1528800, "馬上使用-現金價": 2240000, "分期期數": 36, "管理費": 305500}
-            },
-            "恩典園一期": {
-                "安然2灰": {"定價": 350000, "預購-現金價": 210000, "分期價": 226800, "馬上使用-現金價": 280000, "分期期數": 24, "管理費": 38200},
-                "安然4灰": {"定價": 700000, "預購-現金價": 406000, "分期價": 430360, "馬上使用-現金價": 560000, "分期期數": 24, "管理費": 76400},
-                "安然特區4灰": {"定價": 848000, "預購-現金價": 614800, "分期價": 645540, "馬上使用-現金價": 678400, "分期期數": 24, "管理費": 115700},
-                "晨星2灰": {"定價": 200000, "團購-現金價": 105430, "團購-分期價": 111000, "預購-現金價": 120000, "分期價": 128000, "馬上使用-現金價": 160000, "分期期數": 18, "管理費": 21900,"團購-管理費": 16470}
-            }
-        }
-
-    def _init_memorial_products(self):
-        """初始化牌位產品資料"""
-        return {
-            "永願樓-普羅廳": {
-                "牌位1、2、15、16層": {"定價": 120000, "加購-現金價": 50000, "單購-現金價": 66000, "單購-分期價": None, "分期期數": None, "管理費": 23000},
-                "牌位3、5、12、13層": {"定價": 140000, "加購-現金價": 60000, "單購-現金價": 77000, "單購-分期價": None, "分期期數": None, "管理費": 23000},
-                "牌位6、7、10、11層": {"定價": 160000, "加購-現金價": 70000, "單購-現金價": 88000, "單購-分期價": None, "分期期數": None, "管理費": 23000},
-                "牌位8、9層": {"定價": 190000, "加購-現金價": 85000, "單購-現金價": 99000, "單購-分期價": None, "分期期數": None, "管理費": 23000}
-            },
-            "永願樓-彌陀廳": {
-                "牌位1、2、12、13層": {"定價": 160000, "加購-現金價": 70000, "單購-現金價": 88000, "單購-分期價": None, "分期期數": None, "管理費": 23000},
-                "牌位3、5、10、11層": {"定價": 190000, "加購-現金價": 85000, "單購-現金價": 99000, "單購-分期價": None, "分期期數": None, "管理費": 23000},
-                "牌位6、9層": {"定價": 220000, "加購-現金價": 100000, "單購-現金價": 132000, "單購-分期價": 143000, "分期期數": 24, "管理費": 23000},
-                "牌位7、8層": {"定價": 240000, "加購-現金價": 110000, "單購-現金價": 144000, "單購-分期價": 156000, "分期期數": 24, "管理費": 23000}
-            },
-            "永願樓-大佛廳": {
-                "牌位1、2、10、11層": {"定價": 220000, "加購-現金價": 100000, "單購-現金價": 132000, "單購-分期價": 143000, "分期期數": 24, "管理費": 23000},
-                "牌位3、5、8、9層": {"定價": 260000, "加購-現金價": 120000, "單購-現金價": 156000, "單購-分期價": 169000, "分期期數": 24, "管理費": 23000},
-                "牌位6、7層": {"定價": 290000, "加購-現金價": 135000, "單購-現金價": 174000, "單購-分期價": 188500, "分期期數": 24, "管理費": 23000}
-            }
-        }
-
-    def _init_down_payments(self):
-        """初始化頭款金額（只保留分期購買的頭款）"""
-        return {
-            "澤茵園": {
-                "單灰位": {"分期價": 88560},
-                "貴族2灰": {"分期價": 118320},
-                "家福4灰": {"分期價": 180900},
-                "家族6灰": {"分期價": 247800},
-                "聚賢閣壁龕12灰": {"分期價": 399000},
-                "聚賢閣壁龕18灰": {"分期價": 499800}          
-            },
-            "天璽文創園一期A區": {
-                "寶祥6灰": {"分期價": 306300},
-                "寶祥9灰": {"分期價": 357000},
-                "寶祥15灰": {"分期價": 420000}
-            },
-            "天意園一期": {
-                "永念2灰": {"分期價": 38000},
-                "永願2灰": {"分期價": 82560},
-                "天地合和2灰": {"分期價": 133760},
-                "天地圓融8灰": {"分期價": 296400},
-                "天地福澤12灰": {"分期價": 384000}
-            },
-            "恩典園一期": {
-                "安然2灰": {"分期價": 68400},
-                "安然4灰": {"分期價": 130360},
-                "安然特區4灰": {"分期價": 165540},
-                "晨星2灰": {"團購-分期價": 21000, "分期價": 38000}
-            },
-            "永願樓-彌陀廳": {
-                "牌位6、9層": {"單購-分期價": 42920},
-                "牌位7、8層": {"單購-分期價": 46800}
-            },
-            "永願樓-大佛廳": {
-                "牌位1、2、10、11層": {"單購-分期價": 42920},
-                "牌位3、5、8、9層": {"單購-分期價": 50680},
-                "牌位6、7層": {"單購-分期價": 56500}
-            }
-        }
-
-    def _init_management_down_payments(self):
-        """初始化管理費頭款"""
-        return {
-            "澤茵園": {
-                "單灰位": {"分期價": 16600},
-                "貴族2灰": {"分期價": 22100},
-                "家福4灰": {"分期價": 31700},
-                "家族6灰": {"分期價": 46000},
-                "聚賢閣壁龕12灰": {"分期價": 76000},
-                "聚賢閣壁龕18灰": {"分期價": 87400}               
-            },
-            "天璽文創園一期A區": {
-                "寶祥6灰": {"分期價": 60000},
-                "寶祥9灰": {"分期價": 72800},
-                "寶祥15灰": {"分期價": 87800}
-            },
-            "天意園一期": {
-                "永念2灰": {"分期價": 6600},
-                "永願2灰": {"分期價": 14700},
-                "天地合和2灰": {"分期價": 27300},
-                "天地圓融8灰": {"分期價": 66800},
-                "天地福澤12灰": {"分期價": 78700}
-            },
-     
-            "恩典園一期": {
-                "安然2灰": {"分期價": 11800},
-                "安然4灰": {"分期價": 23600},
-                "安然特區4灰": {"分期價": 31700},
-                "晨星2灰": {"團購-分期價": 6600, "分期價": 6600}
-            },
-            "永願樓-大佛廳": {
-                "牌位1、2、10、11層": {"單購-分期價": 23000},
-                "牌位3、5、8、9層": {"單購-分期價": 23000},
-                "牌位6、7層": {"單購-分期價": 23000}
-            },
-            "永願樓-彌陀廳": {
-                "牌位6、9層": {"單購-分期價": 23000},
-                "牌位7、8層": {"單購-分期價": 23000}
-            }
-        }
+def format_currency(amount):
+    import pandas as pd
 
-    def get_down_payment(self, category, spec, product_price, price_type, quantity):
-        """取得頭款金額"""
-        if '現金' in price_type:
-            return product_price
-        else:
-             return self.down_payments[category][spec][price_type] * quantity
+    if pd.isna(amount) or amount is None:
+        return "0"
+    return f"{amount:,.0f}"
 
-    def get_management_down_payment(self, category, spec, management_fee, price_type, quantity):
-        """取得管理費頭款"""
-        if '現金' in price_type:
-            return management_fee
+# ---------- Quote cache ----------
+def canonical_basket(products):
+    """購物籃的標準形式：排序後的 (園區/廳別, 產品, 座數, 購買方式)，以及排序後每一項在原清單中的位置"""
+    lines = [(product['category'], product['spec'], int(product['quantity']), product['price_type']) for product in products]
+    order = sorted(range(len(lines)), key=lines.__getitem__)
+    return tuple(lines[i] for i in order), order
+
+def build_quote_view(proposal_system, lines):
+    """計算一個購物籃（標準順序的品項），並建立方案詳情頁的明細表格"""
+    import pandas as pd
+
+    products = [{"category": category, "spec": spec, "quantity": quantity, "price_type": price_type}
+                for category, spec, quantity, price_type in lines]
+    totals = proposal_system.calculate_total(products)
+
+    simple_product_data = []
+    installment_details = []
+    # 每個品項在產品分期明細中的列（沒有分期為 None）
+    installment_positions = []
+    for detail in totals['product_details']:
+        simple_product_data.append({
+            '追思空間': detail['category'],
+            '產品': detail['spec'],
+            '座數': detail['quantity'],
+            '購買方式': detail['price_type'],
+            '定價': format_currency(detail['original_price']),
+            '優惠價': format_currency(detail['product_price']),
+            '管理費': format_currency(detail['management_fee'])
+        })
+        if detail['installment_terms']:
+            installment_positions.append(len(installment_details))
+            installment_details.append({
+                '追思空間': detail['category'],
+                '產品': detail['spec'],
+                '座數': detail['quantity'],
+                '期數': f"{detail['installment_terms']}期",
+                '產品頭款': format_currency(detail['product_down_payment']),
+                '產品期款': format_currency(detail['product_monthly_payment']),
+                '管理費頭款': format_currency(detail['management_down_payment']),
+                '管理費期款': format_currency(detail['management_monthly_payment'])
+            })
         else:
-            return self.management_down_payments[category][spec][price_type] * quantity
-
-    def calculate_installment_payment(self, product_price, management_fee, installment_terms, down_payment_amount, management_down_payment_amount):
-        """計算分期付款"""
-        if not installment_terms:
-            return 0
-
-        total_price = product_price + management_fee
-        total_down_payment = down_payment_amount + management_down_payment_amount
-        monthly_payment = (total_price - total_down_payment) / installment_terms
-
-        return monthly_payment
-
-    def calculate_product_installment_payment(self, product_price, installment_terms, down_payment_amount):
-        """計算產品分期付款"""
-        if not installment_terms:
-            return 0
-
-        monthly_payment = (product_price - down_payment_amount) / installment_terms
-        return monthly_payment
-
-    def calculate_management_installment_payment(self, management_fee, installment_terms, management_down_payment_amount):
-        """計算管理費分期付款"""
-        if not installment_terms:
-            return 0
-
-        monthly_payment = (management_fee - management_down_payment_amount) / installment_terms
-        return monthly_payment
-
-    def calculate_total(self, selected_products):
-        total_original = 0
-        total_discounted = 0
-        total_management_fee = 0
-        total_down_payment = 0
-        total_management_down_payment = 0
-        product_details = []
-
-        for product in selected_products:
-            if product['type'] == 'cemetery':
-                product_data = self.cemetery_products[product['category']][product['spec']]
-            else:
-                product_data = self.memorial_products[product['category']][product['spec']]
-
-            quantity = product['quantity']
-            price_type = product['price_type']  # 現在直接是中文
-
-            # 直接使用中文 price_type 作為價格鍵值
-            product_price = product_data[price_type] * quantity
-            original_price = product_data['定價'] * quantity
-            # 修正：晨星團購價要抓團購管理費
-            if product['category'] == "恩典園一期" and product['spec'] == "晨星2灰" and '團購' in price_type:
-                management_fee_per_unit = product_data.get('團購-管理費', 0)
-            else:
-                management_fee_per_unit = product_data.get('管理費', 0)
+            installment_positions.append(None)
+
+    return {
+        "catalog": proposal_system.catalog,
+        "totals": totals,
+        "product_table": pd.DataFrame(simple_product_data),
+        "installment_table": pd.DataFrame(installment_details) if installment_details else None,
+        "installment_positions": installment_positions,
+    }
 
-            management_fee = management_fee_per_unit * quantity
+class QuoteCache:
+    """程序共用的報價快取：以價格表版本與標準購物籃為鍵，保存計算結果與已建立的表格（LRU，有上限）
+
+    多數業務賣的是同樣幾種產品，相同購物籃（不論加入順序）直接沿用結果，
+    只改側邊欄客戶姓名等造成的 rerun 也不需重新計算。
+    """
+
+    def __init__(self, maxsize=256):
+        self.cache = LRUCache(maxsize=maxsize)
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def get(self, proposal_system, products):
+        """回傳 (報價, 排序後每一項在 products 中的位置)；快取中的內容不可修改"""
+        catalog = proposal_system.catalog
+        lines, order = canonical_basket(products)
+        key = (catalog.version, catalog.effective_from, lines)
+        with self._lock:
+            view = self.cache.get(key)
+        # 價格表檔案重新載入後版本號可能沒變，需是同一個價格表物件才沿用
+        if view is not None and view["catalog"] is catalog:
+            with self._lock:
+                self.stats["hits"] += 1
+            return view, order
+        view = build_quote_view(proposal_system, lines)
+        with self._lock:
+            self.cache.set(key, view)
+            self.stats["misses"] += 1
+        return view, order
+
+    def status(self):
+        with self._lock:
+            return {**self.stats, "size": len(self.cache), "maxsize": self.cache.maxsize}
+
+@st.cache_resource
+def get_quote_cache():
+    return QuoteCache(maxsize=int(get_setting("quote_cache_size", 256)))
+
+def quote_tables(view, order):
+    """依本 session 加入產品的順序排列快取中的明細表格（順序相同時直接沿用）"""
+    product_table, installment_table = view["product_table"], view["installment_table"]
+    if order == sorted(order):
+        return product_table, installment_table
+    # order[j] 為排序後第 j 項在原清單中的位置，反推原清單每一項對應的排序位置
+    positions = [0] * len(order)
+    for j, i in enumerate(order):
+        positions[i] = j
+    product_table = product_table.iloc[positions]
+    if installment_table is not None:
+        rows = [view["installment_positions"][j] for j in positions]
+        installment_table = installment_table.iloc[[row for row in rows if row is not None]]
+    return product_table, installment_table
+    
+def save_customer_updates(customer_id, updates):
+    """儲存客戶修改：啟用 write_behind 時放入延後寫入佇列，否則直接寫入資料庫"""
+    if write_behind_enabled():
+        get_write_queue().enqueue_update("customers", "id", customer_id, updates, owner=st.session_state.get("agent_id"))
+        patch_duplicate_index(customer_id, updates)
+        return True
+    return update_customer(customer_id, updates)
 
-            # 計算產品頭款
-            product_down_payment = self.get_down_payment(product['category'], product['spec'], product_price, price_type, quantity)
-            total_down_payment += product_down_payment
+def diff_customer_fields(original, values):
+    """比對表單值與快取中的客戶資料，只回傳有變更的欄位（None 與空字串視為相同）"""
+    return {
+        field: value for field, value in values.items()
+        if (original.get(field) or "") != (value or "")
+    }
 
-            # 計算管理費頭款
-            management_down_payment = self.get_management_down_payment(product['category'], product['spec'], management_fee, price_type, quantity)
-            total_management_down_payment += management_down_payment
+def record_customer_write(outcome):
+    """累計客戶小卡片的寫入結果：written / unchanged（送出但未修改）/ not_submitted（未送出）/ duplicate（電話或Email重複）"""
+    if "customer_write_stats" not in st.session_state:
+        st.session_state.customer_write_stats = {"written": 0, "unchanged": 0, "not_submitted": 0, "failed": 0, "duplicate": 0}
+    st.session_state.customer_write_stats[outcome] += 1
+
+class CustomerStore:
+    """session 內目前顯示的客戶資料：id 索引 + 欄位陣列 + 版本號
+
+    修改單筆客戶為 O(1)；表格用的 DataFrame 只在版本號變更時才重建。
+    """
+
+    def __init__(self, columns=CUSTOMER_GRID_COLUMNS):
+        self.columns = list(columns)
+        self.version = 0
+        self._rows = None
+        self._index = {}
+        self._arrays = {column: [] for column in self.columns}
+        self._frame = None
+        self._frame_version = -1
+
+    def load(self, rows, force=False):
+        """載入一批客戶（同一個列表物件重複載入時略過，除非 force）"""
+        if rows is self._rows and not force:
+            return
+        self._rows = rows
+        self._index = {row["id"]: pos for pos, row in enumerate(rows)}
+        self._arrays = {column: [row.get(column) for row in rows] for column in self.columns}
+        self.version += 1
+
+    def reload(self):
+        """原列表內容有增減時重建索引與欄位陣列"""
+        if self._rows is not None:
+            self.load(self._rows, force=True)
+
+    def get(self, customer_id):
+        pos = self._index.get(customer_id)
+        return None if pos is None else self._rows[pos]
+
+    def patch(self, customer_id, updates):
+        """更新單筆客戶；原始列同步更新，分頁與搜尋快取中的同一筆資料也會一併反映"""
+        pos = self._index.get(customer_id)
+        if pos is None:
+            return False
+        self._rows[pos].update(updates)
+        for column, value in updates.items():
+            if column in self._arrays:
+                self._arrays[column][pos] = value
+        self.version += 1
+        return True
 
-            # 計算總價
-            total_original += original_price
-            total_discounted += product_price
-            total_management_fee += management_fee
+    def to_frame(self):
+        if self._frame_version != self.version:
+            import pandas as pd
 
-            # 只有分期價才顯示分期期數
-            installment_terms = product_data.get('分期期數') if '分期' in price_type else None
+            self._frame = pd.DataFrame(self._arrays, columns=self.columns)
+            self._frame_version = self.version
+        return self._frame
 
-            # 計算產品期款和管理費期款
-            product_monthly_payment = 0
-            management_monthly_payment = 0
+    def __len__(self):
+        return len(self._index)
 
-            if '分期' in price_type and installment_terms:
-                product_monthly_payment = self.calculate_product_installment_payment(
-                    product_price, installment_terms, product_down_payment
-                )
-                management_monthly_payment = self.calculate_management_installment_payment(
-                    management_fee, installment_terms, management_down_payment
-                )
-
-            # 購買方式顯示
-            display_price_type = price_type
-            if '分期' in price_type and installment_terms:
-                display_price_type = f"{price_type}-{installment_terms}期"
-
-            product_details.append({
-                'category': product['category'],
-                'spec': product['spec'],
-                'quantity': quantity,
-                'price_type': display_price_type,
-                'original_price':original_price,
-                'product_price': product_price,
-                'management_fee_per_unit': management_fee_per_unit,
-                'management_fee': management_fee,
-                'installment_terms': installment_terms,
-                'product_down_payment': product_down_payment,
-                'product_monthly_payment': product_monthly_payment,
-                'management_down_payment': management_down_payment,
-                'management_monthly_payment': management_monthly_payment
-            })
+def update_customer_in_session(customer_id, updates):
+    """更新 session_state 的資料"""
+    if not st.session_state.customer_store.patch(customer_id, updates):
+        return False
+    # 如果目前選中的 customer 是這個，也同步更新
+    if "selected_customer" in st.session_state and st.session_state.selected_customer["id"] == customer_id:
+        st.session_state.selected_customer.update(updates)
+    return True
+
+# ---------- Duplicate detection ----------
+def normalize_phone(value):
+    """電話只保留數字（全形先轉半形）；台灣手機 +886 / 886 開頭或省略 0 的格式統一為 09xxxxxxxx"""
+    text = unicodedata.normalize("NFKC", str(value or ""))
+    digits = "".join(ch for ch in text if "0" <= ch <= "9")
+    if digits.startswith("886") and len(digits) == 12:
+        digits = "0" + digits[3:]
+    elif digits.startswith("9") and len(digits) == 9:
+        digits = "0" + digits
+    return digits
+
+def normalize_email(value):
+    return unicodedata.normalize("NFKC", str(value or "")).strip().lower()
+
+class DuplicateCustomerError(ValueError):
+    """電話或 Email 已有其他客戶使用"""
+
+    def __init__(self, field, customer_id):
+        super().__init__(f"{field} 已被客戶 {customer_id} 使用")
+        self.field = field
+        self.customer_id = customer_id
+
+class CustomerDuplicateIndex:
+    """重複客戶檢查用的記憶體雜湊索引：正規化電話 / Email -> 客戶 id，新增前檢查為 O(1)
+
+    啟動時以 keyset 分頁載入全部客戶的 id、電話、Email，之後依 updated_at 高水位增量更新；
+    高水位看不到刪除，因此每 reconcile_seconds 另外掃過全部客戶 id，移除已不存在的客戶。
+    資料庫端另有 normalize_phone / normalize_email 唯一索引把關（見 supabase_indexes.sql）。
+    """
+
+    def __init__(self, repository, refresh_seconds=30, page_size=1000, reconcile_seconds=600):
+        self.repository = repository
+        self.refresh_seconds = refresh_seconds
+        self.page_size = page_size
+        self.reconcile_seconds = reconcile_seconds
+        self.reconciled_at = None
+        self._owners = {}   # "phone:0912345678" / "email:a@b.com" -> 客戶 id
+        self._keys = {}     # 客戶 id -> {"phone": key, "email": key}
+        self._lock = threading.Lock()
+        # 同一時間只有一個 session 執行載入 / 增量更新，其餘等待後沿用結果
+        self._refresh_lock = threading.Lock()
+        self.mark = None
+        self.refreshed_at = None
+
+    @staticmethod
+    def _key(field, value):
+        normalized = normalize_phone(value) if field == "phone" else normalize_email(value)
+        return f"{field}:{normalized}" if normalized else None
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _advance(self, updated_at):
+        if updated_at is not None and (self.mark is None or updated_at > self.mark):
+            self.mark = updated_at
+
+    def load(self):
+        """載入全部客戶（只取 id、電話、Email）"""
+        with self._refresh_lock:
+            self._load()
+
+    def _load(self):
+        columns = ["id", "phone", "email", "updated_at"]
+        after_id = None
+        while True:
+            rows = self.repository.fetch_customers_page(after_id, self.page_size, columns) or []
+            # 伺服器端可能限制每次回傳筆數（Supabase 預設 1000），回傳空頁才代表載入完畢
+            if not rows:
+                break
+            for row in rows:
+                self.patch(row["id"], phone=row.get("phone"), email=row.get("email"))
+                self._advance(row.get("updated_at"))
+            after_id = rows[-1]["id"]
+        self.refreshed_at = self.reconciled_at = time.monotonic()
+
+    def _reconcile(self):
+        """移除資料庫中已不存在的客戶（只取 id）"""
+        existing, after_id, newest = set(), None, None
+        while True:
+            rows = self.repository.fetch_customers_page(after_id, self.page_size, ["id"]) or []
+            if not rows:
+                break
+            if newest is None:
+                newest = rows[0]["id"]
+            existing.update(row["id"] for row in rows)
+            after_id = rows[-1]["id"]
+        with self._lock:
+            customer_ids = list(self._keys)
+        for customer_id in customer_ids:
+            # 延後寫入中的新增以 client_key（字串）為鍵，尚未寫入資料庫；比掃描時最新 id 還新的是掃描期間新增的
+            if isinstance(customer_id, str) or (newest is not None and customer_id > newest):
+                continue
+            if customer_id not in existing:
+                self.remove(customer_id)
+        self.reconciled_at = time.monotonic()
+
+    def _stale(self, force):
+        return self.refreshed_at is None or force or time.monotonic() - self.refreshed_at >= self.refresh_seconds
+
+    def refresh(self, force=False):
+        """超過 refresh_seconds 時取回高水位之後變更的客戶（包含其他人新增或修改的）"""
+        if not self._stale(force):
+            return
+        with self._refresh_lock:
+            # 等待期間其他 session 可能已更新完畢
+            if self.refreshed_at is None:
+                return self._load()
+            if not self._stale(force):
+                return
+            for row in self.repository.fetch_customers_changed_since(self.mark):
+                self.patch(row["id"], phone=row.get("phone"), email=row.get("email"))
+                self._advance(row.get("updated_at"))
+            if self.reconcile_seconds and time.monotonic() - self.reconciled_at >= self.reconcile_seconds:
+                self._reconcile()
+            self.refreshed_at = time.monotonic()
+
+    def patch(self, customer_id, **fields):
+        """設定客戶的電話 / Email（只更新有傳入的欄位）"""
+        with self._lock:
+            keys = self._keys.setdefault(customer_id, {})
+            for field, value in fields.items():
+                old = keys.pop(field, None)
+                if old is not None and self._owners.get(old) == customer_id:
+                    del self._owners[old]
+                key = self._key(field, value)
+                if key is not None:
+                    keys[field] = key
+                    self._owners[key] = customer_id
+
+    def remove(self, customer_id):
+        with self._lock:
+            for key in self._keys.pop(customer_id, {}).values():
+                if self._owners.get(key) == customer_id:
+                    del self._owners[key]
+
+    def find(self, phone=None, email=None, exclude_id=None):
+        """回傳第一個衝突的 (欄位, 客戶 id)，沒有重複時回傳 None"""
+        for field, value in (("phone", phone), ("email", email)):
+            key = self._key(field, value)
+            owner = self._owners.get(key) if key is not None else None
+            if owner is not None and owner != exclude_id:
+                return field, owner
+        return None
 
-        discount_rate = (total_original - total_discounted) / total_original if total_original > 0 else 0
-        final_total = total_discounted + total_management_fee
+@st.cache_resource
+def get_duplicate_index():
+    """程序共用的重複客戶索引（跨業務、跨營業處檢查）"""
+    return CustomerDuplicateIndex(
+        get_repository(),
+        refresh_seconds=float(get_setting("duplicate_index_refresh", 30)),
+        page_size=int(get_setting("duplicate_index_page_size", 1000)),
+        reconcile_seconds=float(get_setting("duplicate_index_reconcile", 600)),
+    )
 
+def find_duplicate_customer(phone=None, email=None, exclude_id=None):
+    """檢查電話 / Email 是否已有其他客戶使用，回傳 (欄位, 客戶 id) 或 None"""
+    index = get_duplicate_index()
+    index.refresh()
+    return index.find(phone, email, exclude_id)
+
+# ---------- Customer import ----------
+# 匯入檔可接受的欄位名稱（不分大小寫）
+IMPORT_COLUMN_ALIASES = {
+    "customer_name": ("customer_name", "name", "姓名", "客戶姓名"),
+    "phone": ("phone", "電話", "聯絡電話", "手機"),
+    "email": ("email", "e-mail", "電子郵件"),
+}
+# 逐列錯誤報告最多保留的筆數（超過只計數），避免大檔案錯誤過多時佔用記憶體
+IMPORT_MAX_ERRORS = 1000
+
+def map_import_columns(header):
+    """依標題列找出各欄位的位置，回傳 {欄位: 索引}"""
+    positions = {}
+    names = [str(cell or "").strip().lower() for cell in header]
+    for field, aliases in IMPORT_COLUMN_ALIASES.items():
+        for index, name in enumerate(names):
+            if name in aliases:
+                positions[field] = index
+                break
+    return positions
+
+def iter_import_records(file, filename):
+    """逐列讀取匯入檔，產生 (列號, {欄位: 值}, 進度 0~1)；以串流方式讀取，不會建立整個檔案的 DataFrame"""
+    def to_record(positions, values):
         return {
-            "total_original": total_original,
-            "total_discounted": total_discounted,
-            "total_management_fee": total_management_fee,
-            "total_down_payment": total_down_payment,
-            "total_management_down_payment": total_management_down_payment,
-            "discount_rate": discount_rate,
-            "final_total": final_total,
-            "product_details": product_details
+            field: values[index] if index < len(values) else None
+            for field, index in positions.items()
         }
 
-def format_currency(amount):
-    if pd.isna(amount) or amount is None:
-        return "0"
-    return f"{amount:,.0f}"
-    
-def update_customer_db(customer_id, updates):
-    supabase = get_supabase()
-    resp = supabase.table("customers").update(updates).eq("id", customer_id).execute()
-    # 如果成功回傳 True
-    return resp.data is not None
+    if filename.lower().endswith(".csv"):
+        total = file.seek(0, io.SEEK_END) or 1
+        file.seek(0)
+        text = io.TextIOWrapper(file, encoding=get_setting("import_csv_encoding", "utf-8-sig"), newline="")
+        try:
+            reader = csv.reader(text)
+            positions = map_import_columns(next(reader, []))
+            for line_no, values in enumerate(reader, start=2):
+                yield line_no, to_record(positions, values), min(file.tell() / total, 1.0)
+        finally:
+            # 不讓 TextIOWrapper 關閉上傳的檔案
+            text.detach()
+    else:
+        import openpyxl
+
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            total = workbook.active.max_row or 0
+            positions = map_import_columns(next(rows, ()))
+            for line_no, values in enumerate(rows, start=2):
+                yield line_no, to_record(positions, values), min(line_no / total, 1.0) if total else 0.0
+        finally:
+            workbook.close()
+
+def prepare_import_row(record):
+    """檢查並正規化一列匯入資料，回傳 (客戶資料, 錯誤訊息)"""
+    name = str(record.get("customer_name") or "").strip()
+    phone = normalize_phone(record.get("phone"))
+    email = normalize_email(record.get("email"))
+    if not name:
+        return None, "缺少姓名"
+    if not phone and not email:
+        return None, "缺少電話或Email"
+    if phone and not (8 <= len(phone) <= 12):
+        return None, f"電話格式不正確：{record.get('phone')}"
+    if email and ("@" not in email or " " in email):
+        return None, f"Email 格式不正確：{record.get('email')}"
+    # 以正規化後的電話（沒有電話時用 Email）產生冪等鍵，重複匯入同一位客戶不會新增第二筆
+    dedupe_key = phone or email
+    client_key = "import:" + hashlib.sha256(dedupe_key.encode("utf-8")).hexdigest()[:32]
+    return {"customer_name": name, "phone": phone or None, "email": email or None, "client_key": client_key}, None
+
+def import_customers(file, filename, agent_id=None, office=None, chunk_size=500, on_progress=None):
+    """串流匯入客戶：逐列檢查與正規化，每 chunk_size 筆以 upsert（與既有客戶衝突即略過）批次寫入
+
+    電話或 Email 與既有客戶（含本檔案先前的列）重複者先以重複檢查索引略過；
+    記憶體只保留目前這一批資料，與檔案大小無關；回傳統計與逐列錯誤報告。
+    """
+    repository = get_repository()
+    duplicate_index = get_duplicate_index()
+    duplicate_index.refresh(force=True)
+    report = {"rows": 0, "inserted": 0, "duplicates": 0, "error_count": 0, "errors": []}
+    chunk = {}
+    # 本批次內已出現的電話 / Email
+    chunk_keys = set()
+
+    def add_error(line_no, message):
+        report["error_count"] += 1
+        if len(report["errors"]) < IMPORT_MAX_ERRORS:
+            report["errors"].append({"列號": line_no, "錯誤": message})
+
+    def flush():
+        rows = [row for _, row in chunk.values()]
+        try:
+            inserted = repository.upsert_customers(rows)
+        except repository.errors as e:
+            for line_no, _ in chunk.values():
+                add_error(line_no, f"寫入失敗：{e}")
+        else:
+            for row in inserted:
+                duplicate_index.patch(row["id"], phone=row.get("phone"), email=row.get("email"))
+            report["inserted"] += len(inserted)
+            report["duplicates"] += len(rows) - len(inserted)
+        chunk.clear()
+        chunk_keys.clear()
+
+    progress = 0.0
+    for line_no, record, progress in iter_import_records(file, filename):
+        if not any(str(value or "").strip() for value in record.values()):
+            continue
+        report["rows"] += 1
+        row, error = prepare_import_row(record)
+        if error:
+            add_error(line_no, error)
+            continue
+        keys = {("phone", row["phone"]), ("email", row["email"])} - {("phone", None), ("email", None)}
+        if row["client_key"] in chunk or keys & chunk_keys or duplicate_index.find(row["phone"], row["email"]):
+            report["duplicates"] += 1
+            continue
+        chunk_keys.update(keys)
+        if agent_id:
+            row["agent_id"] = agent_id
+        if office:
+            row["office"] = office
+        chunk[row["client_key"]] = (line_no, row)
+        if len(chunk) >= chunk_size:
+            flush()
+            if on_progress:
+                on_progress(progress, report)
+    if chunk:
+        flush()
+    if on_progress:
+        on_progress(1.0, report)
+    return report
+
+# ---------- Export ----------
+# 匯出資料表：(keyset 分頁用的主鍵, 日期區間篩選欄位)
+EXPORT_TABLES = {
+    "customers": ("id", "updated_at"),
+    "contact_logs": ("contact_id", "contact_date"),
+}
+# 匯出欄位與標題（依輸出順序）
+EXPORT_COLUMNS = {
+    "customers": {
+        "id": "客戶編號", "customer_name": "姓名", "phone": "電話", "email": "Email",
+        "agent_id": "業務", "office": "營業處", "updated_at": "最後更新",
+    },
+    "contact_logs": {
+        "contact_id": "紀錄編號", "id": "客戶編號", "contact_date": "聯絡日期", "note": "內容", "agent_id": "業務",
+    },
+}
+
+def build_export_filters(customer_scope, agent_id=None, date_range=()):
+    """匯出篩選條件：一律限制在登入業務的資料範圍內，營業處範圍可再指定業務；date_range 為 (起, 迄) 日期"""
+    filters = dict(customer_scope)
+    if agent_id and "office" in filters:
+        filters["agent_id"] = agent_id.strip().upper()
+    if len(date_range) == 2:
+        filters["date_from"] = date_range[0].isoformat()
+        # 迄日包含當天
+        filters["date_to"] = (date_range[1] + timedelta(days=1)).isoformat()
+    return filters
+
+def iter_export_rows(table, filters=None, page_size=1000):
+    """依主鍵遞增以 keyset 分頁逐筆產生匯出資料，同時只保留一頁在記憶體"""
+    key = EXPORT_TABLES[table][0]
+    repository = get_repository()
+    after = None
+    while True:
+        rows = repository.fetch_export_page(table, after, page_size, filters)
+        # page_size 超過伺服器的單次回傳上限時每頁都會「不足」，回傳空頁才代表匯出完畢
+        if not rows:
+            return
+        yield from rows
+        after = rows[-1][key]
+
+def write_export(table, target, file_format="csv", filters=None, page_size=1000):
+    """將匯出資料逐頁寫入二進位檔案 target（CSV 或 openpyxl write_only 模式的 XLSX），回傳筆數"""
+    columns = EXPORT_COLUMNS[table]
+    count = 0
+    if file_format == "xlsx":
+        import openpyxl
+
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet(table)
+        sheet.append(list(columns.values()))
+        for row in iter_export_rows(table, filters, page_size):
+            sheet.append([row.get(column) for column in columns])
+            count += 1
+        workbook.save(target)
+        return count
+
+    # utf-8-sig 讓 Excel 直接開啟 CSV 時不會亂碼
+    text = io.TextIOWrapper(target, encoding="utf-8-sig", newline="")
+    try:
+        writer = csv.writer(text)
+        writer.writerow(columns.values())
+        for row in iter_export_rows(table, filters, page_size):
+            writer.writerow([row.get(column) for column in columns])
+            count += 1
+    finally:
+        text.flush()
+        text.detach()
+    return count
+
+# ---------- Startup prefetch ----------
+ASSET_BASE_URL = "https://raw.githubusercontent.com/m9606286/green-garden-app/main/my_app/"
+ASSET_FILES = ["綠金園.png", "晨暉logo.png"]
+# 程序內的圖檔快取 {檔名: bytes}
+_asset_cache = {}
+# 同步 I/O 工作使用的共用執行緒池（不隨每次 asyncio.run 關閉，逾時的工作不會拖住畫面）
+_startup_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="startup")
+
+async def fetch_asset(filename, timeout=5.0):
+    """讀取圖檔：優先使用與 app 同目錄的檔案，沒有時才非同步從 GitHub 下載"""
+    path = Path(__file__).with_name(filename)
+    if path.exists():
+        data = await asyncio.get_running_loop().run_in_executor(_startup_executor, path.read_bytes)
+    else:
+        import httpx
+
+        async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
+            response = await client.get(ASSET_BASE_URL + quote(filename))
+            response.raise_for_status()
+            data = response.content
+    _asset_cache[filename] = data
+    return data
+
+def get_asset(filename):
+    """已預先載入的圖檔（尚未載入時回傳 GitHub 網址，由瀏覽器自行下載）"""
+    return _asset_cache.get(filename) or ASSET_BASE_URL + filename
+
+async def _run_timed(name, awaitable, timeout, fallback, timings):
+    started = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(awaitable, timeout)
+        status = "ok"
+    except asyncio.TimeoutError:
+        result, status = fallback, "timeout"
+    except Exception as e:
+        print(f"Startup fetch {name} error:", e)
+        result, status = fallback, f"error: {type(e).__name__}"
+    timings[name] = {"ms": round((time.perf_counter() - started) * 1000, 1), "status": status}
+    return result
+
+def run_concurrently(tasks):
+    """並行執行多個彼此獨立的 I/O 工作，回傳 (結果, 各工作耗時)
+
+    tasks 為 {名稱: (函式, 逾時秒數, 失敗時的備援值)}；一般函式交給共用執行緒池執行，
+    coroutine 函式直接 await。逾時的工作改用備援值，執行緒仍會自行完成但不再等待。
+    """
+    async def gather():
+        loop = asyncio.get_running_loop()
+        timings = {}
+        awaitables = [
+            _run_timed(
+                name,
+                func() if asyncio.iscoroutinefunction(func) else loop.run_in_executor(_startup_executor, func),
+                timeout, fallback, timings,
+            )
+            for name, (func, timeout, fallback) in tasks.items()
+        ]
+        results = await asyncio.gather(*awaitables)
+        return dict(zip(tasks, results)), timings
+
+    if not tasks:
+        return {}, {}
+    return asyncio.run(gather())
+
+def needs_customer_session(customer_scope):
+    return "customer_pager" not in st.session_state or st.session_state.customer_pager.scope != customer_scope
+
+def prefetch_startup_data():
+    """冷啟動時並行取得業務名單、第一頁客戶、同步起點與圖檔，首次畫面只需等待最慢的一項
+
+    名單與圖檔每個 session 只預取一次；客戶資料在登入（或換人）後尚未建立客戶 session 時才預取。
+    已記錄的耗時不會被之後的預取覆蓋。
+    """
+    timeout = float(get_setting("startup_fetch_timeout", 8))
+    tasks = {}
+    if "startup_timings" not in st.session_state:
+        roster_cache = get_roster_cache(ROSTER_URL)
+        tasks["roster"] = (roster_cache.get, timeout, None)
+        for filename in ASSET_FILES:
+            if filename not in _asset_cache:
+                tasks[f"asset:{filename}"] = (partial(fetch_asset, filename), timeout, None)
+
+    if st.session_state.get("authorized"):
+        customer_scope = get_customer_scope()
+        if needs_customer_session(customer_scope):
+            # 共用資料來源先在主執行緒建立，背景執行緒只負責查詢（不可呼叫 st.*）
+            repository = get_repository()
+            page_size = int(get_setting("customer_page_size", 200))
+            tasks["customers"] = (
+                partial(repository.fetch_customers_page, None, page_size, CUSTOMER_GRID_COLUMNS, customer_scope),
+                timeout, None,
+            )
+            tasks["customer_sync_mark"] = (partial(repository.fetch_latest_customer_update, customer_scope), timeout, None)
 
-def update_customer_in_session(customer_id, updates):
-    """更新 session_state 的資料"""
-    for idx, c in enumerate(st.session_state.customers):
-        if c["id"] == customer_id:
-            st.session_state.customers[idx].update(updates)
-            # 如果目前選中的 customer 是這個，也同步更新
-            if "selected_customer" in st.session_state and st.session_state.selected_customer["id"] == customer_id:
-                st.session_state.selected_customer.update(updates)
-            return True
-    return False
+    if not tasks:
+        return {}
+    results, timings = run_concurrently(tasks)
+    # 查詢失敗在主執行緒提示；逾時則不提示，之後改為需要時才查詢
+    if "customers" in tasks and results["customers"] is None and timings["customers"]["status"] != "timeout":
+        st.error("無法取得客戶資料")
+    startup_timings = st.session_state.setdefault("startup_timings", {})
+    for name, timing in timings.items():
+        startup_timings.setdefault(name, timing)
+    return results
+
+# 登出時需一併清除的客戶相關 session 資料
+CUSTOMER_SESSION_KEYS = [
+    'customer_pager', 'customer_page', 'customer_store', 'customer_sync', 'customer_search_cache',
+    'customer_write_stats', 'selected_customer', 'contact_log_loader', 'contact_timeline_counts',
+    'customer_import_report', 'customer_export', 'customer_grid_frame',
+]
+
+def format_latest_contact(log, note_length=20):
+    """最近一筆聯絡紀錄的表格摘要：日期加上截短的備註"""
+    if not log:
+        return ""
+    note = str(log.get("note") or "")
+    if len(note) > note_length:
+        note = note[:note_length] + "…"
+    return f"{str(log.get('contact_date', ''))[:10]} {note}".strip()
+
+def with_latest_contacts(customers_df):
+    """在顯示用的副本加上「最近聯絡」欄；本頁所有客戶合併為一次查詢
+
+    加上欄位的 DataFrame 存在 session 中，客戶資料（同一個 DataFrame）與聯絡紀錄快取都沒有變更、
+    且未超過聯絡紀錄快取的存活時間時直接沿用，不在每次重新執行時重建。
+    """
+    if customers_df.empty or "id" not in customers_df.columns:
+        return customers_df
+    loader = get_contact_log_loader()
+    cached = st.session_state.get("customer_grid_frame")
+    if (
+        cached is not None and cached["base"] is customers_df and cached["loader"] is loader
+        and cached["version"] == loader.version
+        and (loader.cache.ttl_seconds is None or time.monotonic() - cached["built_at"] < loader.cache.ttl_seconds)
+    ):
+        return cached["frame"]
+    try:
+        latest = loader.latest(customers_df["id"].tolist(), limit=1)
+    except get_repository().errors as e:
+        st.warning(f"⚠️ 無法載入最近聯絡紀錄：{e}")
+        return customers_df
+    summaries = [format_latest_contact((latest.get(customer_id) or [None])[0]) for customer_id in customers_df["id"]]
+    frame = customers_df.assign(latest_contact=summaries)
+    st.session_state.customer_grid_frame = {
+        "base": customers_df, "loader": loader, "version": loader.version,
+        "built_at": time.monotonic(), "frame": frame,
+    }
+    return frame
 
 def show_customer_table(customers_df):
+    import pandas as pd
+    from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode
+
     st.subheader("📋 客戶列表")
+    customers_df = with_latest_contacts(customers_df)
     gb = GridOptionsBuilder.from_dataframe(customers_df)
     gb.configure_selection("single")
     gb.configure_column("customer_name", header_name="姓名")
     gb.configure_column("phone", header_name="電話")
     gb.configure_column("email", header_name="Email")
+    if "latest_contact" in customers_df.columns:
+        gb.configure_column("latest_contact", header_name="最近聯絡")
     gridOptions = gb.build()
 
     grid_response = AgGrid(
@@ -611,15 +2466,208 @@ def show_customer_table(customers_df):
 
     # 最安全的判斷方式
     if selected_rows and isinstance(selected_rows, list) and len(selected_rows) > 0:
-        st.session_state.selected_customer = selected_rows[0]
+        selected = dict(selected_rows[0])
+        # 「最近聯絡」只供顯示，不屬於客戶資料
+        selected.pop("latest_contact", None)
+        st.session_state.selected_customer = selected
+
+def apply_customer_changes(rows):
+    """將同步取回的客戶變更套用到本 session 的分頁快取、目前顯示資料與選取中的客戶"""
+    customer_store = st.session_state.customer_store
+    added = st.session_state.customer_pager.apply_changes(rows)
+    for row in rows:
+        update_customer_in_session(row["id"], row)
+    if added:
+        # 第一頁多了新客戶，依原列表重建索引
+        customer_store.reload()
+    if "customer_search_cache" in st.session_state:
+        st.session_state.customer_search_cache.clear()
+
+def show_contact_timeline(customer_id):
+    """客戶的聯絡紀錄時間軸，按「載入更多」才往下載入"""
+    st.subheader("🗂️ 聯絡紀錄")
+    page_size = int(get_setting("contact_log_page_size", 20))
+    shown = st.session_state.setdefault("contact_timeline_counts", {}).get(customer_id, page_size)
+    logs, has_more = get_contact_log_loader().timeline(customer_id, shown)
+    if not logs:
+        st.info("尚無聯絡紀錄")
+        return
+    for log in logs:
+        st.markdown(f"**{str(log.get('contact_date', ''))[:16]}**　{log.get('note', '')}")
+    if has_more and st.button("載入更多紀錄", key=f"more_logs_{customer_id}"):
+        st.session_state.contact_timeline_counts[customer_id] = shown + page_size
+        st.rerun()
+
+def refresh_customer_list(customer_scope):
+    """客戶大量變動（例如匯入）後從第一頁重新載入，同步起點移到目前最新的資料"""
+    st.session_state.customer_pager.invalidate()
+    st.session_state.customer_page = 0
+    st.session_state.pop("customer_search_cache", None)
+    st.session_state.customer_sync.mark = fetch_latest_customer_update(customer_scope)
+
+def show_customer_import(customer_scope):
+    """從 Excel / CSV 匯入客戶，顯示進度與逐列錯誤報告"""
+    with st.expander("📥 匯入客戶"):
+        uploaded = st.file_uploader(
+            "選擇 Excel 或 CSV 檔（標題列需含姓名，以及電話或Email）",
+            type=["xlsx", "csv"], key="customer_import_file",
+        )
+        if uploaded is not None and st.button("開始匯入", key="customer_import_start"):
+            progress_bar = st.progress(0.0, text="匯入中…")
+
+            def on_progress(progress, report):
+                progress_bar.progress(progress, text=f"已處理 {report['rows']} 列，新增 {report['inserted']} 位客戶")
+
+            report = import_customers(
+                uploaded, uploaded.name,
+                agent_id=st.session_state.agent_id,
+                office=st.session_state.agent_info.get("office") or None,
+                chunk_size=int(get_setting("import_chunk_size", 500)),
+                on_progress=on_progress,
+            )
+            st.session_state.customer_import_report = report
+            if report["inserted"]:
+                refresh_customer_list(customer_scope)
+
+        # 結果存在 session 中，按下載錯誤報告重新執行後仍會顯示
+        report = st.session_state.get("customer_import_report")
+        if report:
+            st.success(
+                f"✅ 匯入完成：共 {report['rows']} 列，新增 {report['inserted']} 位，"
+                f"略過重複 {report['duplicates']} 位，錯誤 {report['error_count']} 列"
+            )
+            if report["errors"]:
+                import pandas as pd
+
+                errors_df = pd.DataFrame(report["errors"])
+                st.dataframe(errors_df, hide_index=True, use_container_width=True)
+                if report["error_count"] > len(report["errors"]):
+                    st.caption(f"只列出前 {len(report['errors'])} 筆錯誤")
+                st.download_button(
+                    "下載錯誤報告", errors_df.to_csv(index=False).encode("utf-8-sig"),
+                    file_name="import_errors.csv", mime="text/csv",
+                )
+
+def discard_customer_export():
+    """釋放本 session 的匯出檔（下載後、登出或重新匯出時）"""
+    st.session_state.pop("customer_export", None)
+
+def mark_customer_export_downloaded():
+    st.session_state.customer_export.update(downloaded=True, released=False)
+
+def show_customer_export(customer_scope):
+    """匯出客戶或聯絡紀錄（CSV / Excel），逐頁寫入暫存檔後提供下載
+
+    產生時逐頁寫入 SpooledTemporaryFile（小檔留在記憶體，大檔寫到建立時即刪除的匿名檔案），
+    完成後一次讀出交給下載按鈕並關閉暫存檔，之後的重新執行沿用同一份資料，不再重新讀取。
+    下載後的下一次重新執行即釋放，不會一直佔用 session 的記憶體。
+    """
+    with st.expander("📤 匯出資料"):
+        table = st.radio("資料", ["customers", "contact_logs"], horizontal=True, key="export_table",
+                         format_func={"customers": "客戶", "contact_logs": "聯絡紀錄"}.get)
+        file_format = st.radio("格式", ["csv", "xlsx"], horizontal=True, key="export_format",
+                               format_func={"csv": "CSV", "xlsx": "Excel"}.get)
+        date_range = st.date_input("日期區間（客戶依最後更新日，聯絡紀錄依聯絡日期；不選為全部）", value=(), key="export_dates")
+        agent_id = None
+        if "office" in customer_scope:
+            agent_id = st.text_input("業務身份證字號（不填為整個營業處）", key="export_agent")
+
+        if st.button("產生匯出檔", key="export_start"):
+            filters = build_export_filters(customer_scope, agent_id, date_range)
+            discard_customer_export()
+            spool_bytes = int(get_setting("export_spool_bytes", 8 * 1024 * 1024))
+            with st.spinner("匯出中…"), tempfile.SpooledTemporaryFile(max_size=spool_bytes) as target:
+                count = write_export(
+                    table, target, file_format, filters,
+                    page_size=int(get_setting("export_page_size", 1000)),
+                )
+                target.seek(0)
+                data = target.read()
+            st.session_state.customer_export = {
+                "data": data,
+                "file_name": f"{table}_{datetime.now():%Y%m%d_%H%M}.{file_format}",
+                "rows": count,
+            }
+
+        export = st.session_state.get("customer_export")
+        if export and export.get("released"):
+            discard_customer_export()
+            export = None
+        if export:
+            if export.get("downloaded"):
+                # 按下下載後的這次重新執行仍保留按鈕，瀏覽器取檔期間檔案不會被移除；下一次重新執行才釋放
+                export["released"] = True
+            st.caption(f"共 {export['rows']} 筆")
+            st.download_button(
+                "⬇️ 下載", export["data"], file_name=export["file_name"], key="export_download",
+                on_click=mark_customer_export_downloaded,
+            )
+
+def show_customer_pagination(pager):
+    """客戶列表的分頁按鈕（依需要才向資料庫載入下一頁）"""
+    page_no = st.session_state.customer_page
+    col_prev, col_info, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        if st.button("◀ 上一頁", disabled=page_no == 0, use_container_width=True):
+            st.session_state.customer_page = page_no - 1
+            st.rerun()
+    with col_info:
+        st.markdown(f'<div style="text-align: center;">第 {page_no + 1} 頁</div>', unsafe_allow_html=True)
+    with col_next:
+        if st.button("下一頁 ▶", disabled=not pager.has_next(page_no), use_container_width=True):
+            st.session_state.customer_page = page_no + 1
+            st.rerun()
+
+def show_write_queue_status():
+    """顯示延後寫入佇列中本人資料的待寫入與失敗筆數"""
+    status = get_write_queue().status(owner=st.session_state.get("agent_id"))
+    if status["pending"]:
+        st.caption(f"⏳ 待寫入 {status['pending']} 筆")
+    if status["failed"]:
+        st.warning(f"⚠️ {status['failed']} 筆資料寫入失敗")
+        for error in status["errors"]:
+            st.caption(error)
+        if st.button("重新寫入", use_container_width=True):
+            get_write_queue().retry_failed(owner=st.session_state.get("agent_id"))
+            st.rerun()
+
+def show_system_status(auth_system):
+    """顯示系統快取狀態（設定 show_system_status 時才顯示）"""
+    with st.expander("🔧 系統狀態"):
+        st.caption("業務名單快取")
+        st.json(auth_system.roster_cache.status())
+        history = load_price_history(get_setting("price_catalog_path", PRICE_CATALOG_PATH))
+        catalog = history.for_date()
+        st.caption("價格表")
+        st.json({
+            "version": catalog.version, "source": history.source, "entries": len(catalog.entries),
+            "effective_dates": [d.isoformat() for d in history.effective_dates if d != date.min],
+        })
+        st.caption("報價快取")
+        st.json(get_quote_cache().status())
+        if "customer_write_stats" in st.session_state:
+            st.caption("客戶小卡片寫入（本 session）")
+            st.json(st.session_state.customer_write_stats)
+        if "startup_timings" in st.session_state:
+            st.caption("啟動並行載入耗時")
+            st.json(st.session_state.startup_timings)
+        if write_behind_enabled():
+            queue = get_write_queue()
+            st.caption("延後寫入佇列")
+            st.json({**queue.stats, **queue.status(), "last_error": queue.last_error})
 
 def main():
-    # 初始化授權系統
-    auth_system = AuthorizationSystem()
-    
+    configure_page()
+
     # 檢查授權狀態
     if 'authorized' not in st.session_state:
         st.session_state.authorized = False
+
+    # 並行預先取得名單、客戶與圖檔
+    startup = prefetch_startup_data()
+
+    # 初始化授權系統
+    auth_system = AuthorizationSystem()
     
     # 如果未授權，顯示登入頁面
     if not st.session_state.authorized:
@@ -641,10 +2689,16 @@ def main():
         contact_phone = st.text_input("聯絡電話", value="")
         proposal_date = st.date_input("日期", value=datetime.now())
         
+        if write_behind_enabled():
+            show_write_queue_status()
+
+        if get_flag("show_system_status"):
+            show_system_status(auth_system)
+
         # 登出按鈕放在底部
         st.markdown("---")
         if st.button("🚪 登出系統", use_container_width=True):
-            for key in ['authorized', 'agent_id', 'agent_info']:
+            for key in ['authorized', 'agent_id', 'agent_info'] + CUSTOMER_SESSION_KEYS:
                 if key in st.session_state:
                     del st.session_state[key]
             st.rerun()
@@ -655,8 +2709,7 @@ def main():
     col1, col2, col3 = st.columns([1, 2, 1])
     with col1:
         try:
-            image_url = "https://raw.githubusercontent.com/m9606286/green-garden-app/main/my_app/綠金園.png"
-            st.image(image_url, width=120)
+            st.image(get_asset("綠金園.png"), width=120)
         except:
             st.markdown("""
             <div style="width: 120px; height: 120px; background: #2E8B57; border-radius: 10px; display: flex; align-items: center; justify-content: center; color: white; font-weight: bold; font-size: 16px;">
@@ -679,7 +2732,7 @@ def main():
     
 
     # 初始化提案系統
-    proposal_system = GreenGardenProposal()
+    proposal_system = GreenGardenProposal(get_price_catalog(proposal_date))
 
     # 初始化 session state
     if 'selected_products' not in st.session_state:
@@ -689,14 +2742,60 @@ def main():
     tab1, tab2, tab3 = st.tabs(["🧑‍🤝‍🧑 客戶資料", "🛒 產品選擇", "📋 方案詳情"])
     
     with tab1:
-        # 初始化資料
-        if "customers" not in st.session_state:
-            st.session_state.customers = fetch_customers()
+        # 初始化分頁來源，只載入目前頁面；換人登入時依新的範圍重建
+        customer_scope = get_customer_scope()
+        if needs_customer_session(customer_scope):
+            st.session_state.customer_pager = CustomerPager(
+                page_size=int(get_setting("customer_page_size", 200)),
+                max_cached_pages=int(get_setting("customer_page_cache_size", 5)),
+                scope=customer_scope,
+            )
+            # 使用啟動時並行取得的資料；逾時或失敗時改為需要時才查詢
+            if startup.get("customers") is not None:
+                st.session_state.customer_pager.seed_first_page(startup["customers"])
+            st.session_state.customer_page = 0
+            st.session_state.customer_store = CustomerStore()
+            st.session_state.customer_sync = CustomerSync(
+                scope=customer_scope,
+                interval_seconds=float(get_setting("customer_sync_interval", 30)),
+                mark=startup.get("customer_sync_mark"),
+                reconcile_seconds=float(get_setting("customer_reconcile_interval", 300)),
+            )
 
-        customers_df = pd.DataFrame(st.session_state.customers)
+        # 定期（或按下同步）只取回其他人修改過的客戶
+        customer_sync = st.session_state.customer_sync
+        if st.button("🔄 同步最新資料") or customer_sync.due():
+            changed = customer_sync.pull()
+            if changed:
+                apply_customer_changes(changed)
+        if customer_sync.reconcile_due():
+            # 增量同步看不到刪除與移出範圍的客戶：定期依原頁面邊界重新載入已快取的頁面
+            st.session_state.customer_pager.reload_pages()
+            st.session_state.pop("customer_search_cache", None)
+            customer_sync.mark_reconciled()
+
+        show_customer_import(customer_scope)
+        show_customer_export(customer_scope)
+
+        # 搜尋框按 Enter 或離開欄位才送出，字數不足時不查詢
+        search_query = normalize_search_query(
+            st.text_input("🔍 搜尋客戶", key="customer_search", placeholder="輸入姓名、電話或Email（至少2個字）")
+        )
+        searching = len(search_query) >= CUSTOMER_SEARCH_MIN_CHARS
+
+        pager = st.session_state.customer_pager
+        customer_store = st.session_state.customer_store
+        if searching:
+            customer_store.load(get_customer_search_results(search_query, scope=customer_scope))
+        else:
+            customer_store.load(pager.get_page(st.session_state.customer_page))
 
-        # 顯示表格
-        show_customer_table(customers_df)
+        # 顯示表格（資料未變更時沿用同一個 DataFrame）
+        show_customer_table(customer_store.to_frame())
+        if not searching:
+            show_customer_pagination(pager)
+        elif not len(customer_store):
+            st.info("查無符合的客戶")
 
         # 顯示小卡片
         if "selected_customer" in st.session_state:
@@ -707,14 +2806,34 @@ def main():
                 phone = st.text_input("電話", customer["phone"])
                 email = st.text_input("Email", customer["email"])
                 submitted = st.form_submit_button("💾 儲存修改")
-                db_success = update_customer_db(customer["id"], updates)
-    
-                if db_success:
-                   # 再更新 session_state
-                    update_customer_in_session(customer["id"], updates)
-                    st.success("✅ 已更新客戶")
+
+                # 只有按下儲存才寫入，且只送出有變更的欄位
+                if not submitted:
+                    record_customer_write("not_submitted")
                 else:
-                    st.error("❌ 更新失敗")
+                    cached = customer_store.get(customer["id"]) or customer
+                    updates = diff_customer_fields(cached, {"customer_name": name, "phone": phone, "email": email})
+                    duplicate = find_duplicate_customer(
+                        updates.get("phone"), updates.get("email"), exclude_id=customer["id"]
+                    ) if "phone" in updates or "email" in updates else None
+                    if not updates:
+                        record_customer_write("unchanged")
+                        st.info("資料未變更")
+                    elif duplicate:
+                        record_customer_write("duplicate")
+                        field_name = {"phone": "電話", "email": "Email"}[duplicate[0]]
+                        st.error(f"❌ {field_name}已被其他客戶使用（客戶編號 {duplicate[1]}）")
+                    elif save_customer_updates(customer["id"], updates):
+                        record_customer_write("written")
+                        # 再更新 session_state
+                        update_customer_in_session(customer["id"], updates)
+                        # 延後寫入時資料尚在佇列中，以側邊欄的待寫入筆數確認送出
+                        st.success("✅ 已更新客戶（背景寫入中）" if write_behind_enabled() else "✅ 已更新客戶")
+                    else:
+                        record_customer_write("failed")
+                        st.error("❌ 更新失敗")
+
+            show_contact_timeline(customer["id"])
                 
     with tab2:
         # 產品選擇
@@ -722,18 +2841,15 @@ def main():
 
         with col1:
             st.subheader("園區")
-            cemetery_type = st.selectbox("選擇園區",
-                ["請選擇", "澤茵園", "天璽文創園一期A區", "天意園一期", "恩典園一期"])
+            catalog = proposal_system.catalog
+            cemetery_type = st.selectbox("選擇園區", ["請選擇"] + catalog.categories("cemetery"))
 
             if cemetery_type != "請選擇":
-                spec = st.selectbox("產品", list(proposal_system.cemetery_products[cemetery_type].keys()))
+                spec = st.selectbox("產品", catalog.specs("cemetery", cemetery_type))
                 quantity = st.number_input("座數", min_value=1, max_value=10, value=1, key=f"{cemetery_type}_quantity")
 
-                # 根據產品類型設定購買方式選項
-                if cemetery_type == "恩典園一期" and spec == "晨星2灰":
-                    price_options = ["預購-現金價", "分期價", "馬上使用-現金價", "團購-現金價", "團購-分期價"]
-                else:
-                    price_options = ["預購-現金價", "分期價", "馬上使用-現金價"]
+                # 購買方式依價格表中該產品有價格的項目
+                price_options = catalog.price_types("cemetery", cemetery_type, spec)
 
                 price_type = st.radio("購買方式", price_options, key=f"{cemetery_type}_price")
 
@@ -753,17 +2869,13 @@ def main():
 
         with col2:
             st.subheader("牌位")
-            memorial_type = st.selectbox("選擇廳別",
-                ["請選擇", "永願樓-普羅廳", "永願樓-彌陀廳", "永願樓-大佛廳"])
+            memorial_type = st.selectbox("選擇廳別", ["請選擇"] + catalog.categories("memorial"))
 
             if memorial_type != "請選擇":
-                spec = st.selectbox("層別", list(proposal_system.memorial_products[memorial_type].keys()), key=f"{memorial_type}_spec")
+                spec = st.selectbox("層別", catalog.specs("memorial", memorial_type), key=f"{memorial_type}_spec")
                 quantity = st.number_input("座數", min_value=1, max_value=10, value=1, key=f"{memorial_type}_quantity")
 
-                if memorial_type == '永願樓-大佛廳' or (memorial_type == '永願樓-彌陀廳' and spec in ["6、9", "7、8"]):
-                    price_options = ["加購-現金價", "單購-現金價", "單購-分期價"]
-                else:
-                    price_options = ["加購-現金價", "單購-現金價"]
+                price_options = catalog.price_types("memorial", memorial_type, spec)
 
                 price_type = st.radio("購買方式", price_options, key=f"{memorial_type}_price")
 
@@ -801,8 +2913,17 @@ def main():
                 st.info("尚未選擇任何產品")
 
     with tab3:
-        if st.session_state.selected_products:
-            totals = proposal_system.calculate_total(st.session_state.selected_products)
+        # 建議書日期適用的價格表沒有的產品（例如改了日期）不列入計算
+        priced_products = [
+            product for product in st.session_state.selected_products
+            if (product['category'], product['spec'], product['price_type']) in proposal_system.catalog
+        ]
+        if len(priced_products) < len(st.session_state.selected_products):
+            st.warning("部分產品在建議書日期適用的價格表中沒有價格，未列入計算")
+        if priced_products:
+            quote, order = get_quote_cache().get(proposal_system, priced_products)
+            totals = quote['totals']
+            product_table, installment_table = quote_tables(quote, order)
 
             # 價格總覽
             col1, col2, col3, col4 = st.columns(4)
@@ -825,43 +2946,15 @@ def main():
             # 產品明細
             st.markdown('<div style="margin-bottom: -3rem; font-weight: bold;">產品明細</div>', unsafe_allow_html=True)
 
-            simple_product_data = []
-            for detail in totals['product_details']:
-                simple_product_data.append({
-                    '追思空間': detail['category'],
-                    '產品': detail['spec'],
-                    '座數': detail['quantity'],
-                    '購買方式': detail['price_type'],
-                    '定價': format_currency(detail['original_price']),
-                    '優惠價': format_currency(detail['product_price']),
-                    '管理費': format_currency(detail['management_fee'])
-                })
-
-            simple_df = pd.DataFrame(simple_product_data)
             st.markdown('<div class="compact-table half-width-table">', unsafe_allow_html=True)
-            st.dataframe(simple_df, use_container_width=False, hide_index=True)
+            st.dataframe(product_table, use_container_width=False, hide_index=True)
             st.markdown('</div>', unsafe_allow_html=True)
 
             # 產品分期明細（如果有分期產品）
-            installment_details = []
-            for detail in totals['product_details']:
-                if detail['installment_terms']:
-                    installment_details.append({
-                        '追思空間': detail['category'],
-                        '產品': detail['spec'],
-                        '座數': detail['quantity'],
-                        '期數': f"{detail['installment_terms']}期",
-                        '產品頭款': format_currency(detail['product_down_payment']),
-                        '產品期款': format_currency(detail['product_monthly_payment']),
-                        '管理費頭款': format_currency(detail['management_down_payment']),
-                        '管理費期款': format_currency(detail['management_monthly_payment'])
-                    })
-
-            if installment_details:
+            if installment_table is not None:
                 st.markdown('<div style="margin-bottom: -3rem; font-weight: bold;">產品分期明細</div>', unsafe_allow_html=True)
-                installment_df = pd.DataFrame(installment_details)
                 st.markdown('<div class="compact-table half-width-table">', unsafe_allow_html=True)
-                st.dataframe(installment_df, use_container_width=False, hide_index=True)
+                st.dataframe(installment_table, use_container_width=False, hide_index=True)
                 st.markdown('</div>', unsafe_allow_html=True)
 
                 # 分期總結
@@ -871,53 +2964,10 @@ def main():
                 total_management_down_payment = totals['total_management_down_payment']
                 st.markdown(f'<div class="installment-item">頭期款：{format_currency(total_down_payment + total_management_down_payment)} (產品 {format_currency(total_down_payment)}、管理費 {format_currency(total_management_down_payment)})</div>', unsafe_allow_html=True)
 
-                # 計算月繳總額
-                payment_schedule = {}
-                product_payment_schedule = {}
-                management_payment_schedule = {}
-
-                all_terms = []
-                for detail in totals['product_details']:
-                    if detail['installment_terms']:
-                        all_terms.append(detail['installment_terms'])
-
-                if all_terms:
-                    max_term = max(all_terms)
-
-                    for term in range(1, max_term + 1):
-                        payment_schedule[term] = 0
-                        product_payment_schedule[term] = 0
-                        management_payment_schedule[term] = 0
-
-                    for detail in totals['product_details']:
-                        if detail['installment_terms']:
-                            terms = detail['installment_terms']
-                            product_monthly = detail['product_monthly_payment']
-                            management_monthly = detail['management_monthly_payment']
-                            total_monthly = product_monthly + management_monthly
-
-                            for term in range(1, terms + 1):
-                                payment_schedule[term] += total_monthly
-                                product_payment_schedule[term] += product_monthly
-                                management_payment_schedule[term] += management_monthly
-
-                    current_total = payment_schedule[1]
-                    current_product = product_payment_schedule[1]
-                    current_management = management_payment_schedule[1]
-                    start_period = 1
-
-                    for term in range(2, max_term + 2):
-                        if term > max_term or (payment_schedule.get(term, current_total) != current_total):
-                            if start_period == term - 1:
-                                st.markdown(f'<div class="installment-item">第{start_period}期：每期 {format_currency(current_total)} (產品{format_currency(current_product)}、管理費 {format_currency(current_management)})</div>', unsafe_allow_html=True)
-                            else:
-                                st.markdown(f'<div class="installment-item">第{start_period}~{term-1}期：每期 {format_currency(current_total)} (產品{format_currency(current_product)}、管理費 {format_currency(current_management)})</div>', unsafe_allow_html=True)
-
-                            if term <= max_term:
-                                start_period = term
-                                current_total = payment_schedule[term]
-                                current_product = product_payment_schedule[term]
-                                current_management = management_payment_schedule[term]
+                # 每期金額相同的連續期數由計價核心合併為一段
+                for segment in totals['payment_schedule']:
+                    periods = f"第{segment.start}期" if segment.start == segment.end else f"第{segment.start}~{segment.end}期"
+                    st.markdown(f'<div class="installment-item">{periods}：每期 {format_currency(segment.total)} (產品{format_currency(segment.product)}、管理費 {format_currency(segment.management)})</div>', unsafe_allow_html=True)
 
             # 規劃配置分析
             st.markdown('<div class="analysis-title">「早規劃、早安心，現在購買最划算」</div>', unsafe_allow_html=True)
@@ -938,8 +2988,7 @@ def main():
         # 基本資訊顯示在建議書最下方
         col1, col2 = st.columns([1, 4])
         with col1:
-            morning_logo_url = "https://raw.githubusercontent.com/m9606286/green-garden-app/main/my_app/晨暉logo.png"
-            st.image(morning_logo_url, width=200)
+            st.image(get_asset("晨暉logo.png"), width=200)
 
         col1, col2, col3 = st.columns(3)
         with col1:
@@ -0,0 +1,204 @@
+"""批次報價：讀取 CSV / Excel 購物籃檔，以多個程序平行計價並逐批寫出結果（不載入 Streamlit）
+
+輸入欄位：customer、category、spec、quantity、price_type（也接受 客戶、園區、產品、座數、購買方式 等中文標題），
+同一位客戶的品項需相鄰，會合併為一個購物籃。
+執行方式：python my_app/batch_quote.py baskets.csv quotes.csv [--date 2025-01-01] [--workers 4]
+"""
+import argparse
+import csv
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from datetime import date
+from pathlib import Path
+
+from pricing import load_price_catalog, quote_baskets
+
+INPUT_ALIASES = {
+    "customer": ("customer", "客戶", "客戶姓名"),
+    "category": ("category", "園區", "廳別", "追思空間"),
+    "spec": ("spec", "產品", "層別"),
+    "quantity": ("quantity", "座數", "數量"),
+    "price_type": ("price_type", "購買方式"),
+}
+TOTAL_COLUMNS = [
+    "total_original", "total_discounted", "discount_rate", "total_management_fee", "final_total",
+    "total_down_payment", "total_management_down_payment",
+    "max_installment_terms", "first_monthly_payment", "first_product_monthly_payment", "first_management_monthly_payment",
+]
+OUTPUT_COLUMNS = ["customer", "lines"] + TOTAL_COLUMNS + ["error"]
+
+
+def _records(rows):
+    rows = iter(rows)
+    header = [str(cell or "").strip().lower() for cell in next(rows, ())]
+    positions = {
+        field: next((i for i, name in enumerate(header) if name in aliases), None)
+        for field, aliases in INPUT_ALIASES.items()
+    }
+    missing = [field for field, position in positions.items() if position is None]
+    if missing:
+        raise SystemExit(f"輸入檔缺少欄位：{', '.join(missing)}")
+    for values in rows:
+        if not any(value not in (None, "") for value in values):
+            continue
+        yield {field: values[i] if i < len(values) else None for field, i in positions.items()}
+
+
+def read_rows(path):
+    """逐列讀取輸入檔（CSV 或 openpyxl 唯讀模式），產生 {欄位: 值}"""
+    if path.suffix.lower() == ".csv":
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            yield from _records(csv.reader(f))
+    else:
+        import openpyxl
+
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            yield from _records(workbook.active.iter_rows(values_only=True))
+        finally:
+            workbook.close()
+
+
+def read_baskets(path):
+    """相鄰且客戶相同的列合併為一個購物籃，產生 (客戶, [品項])"""
+    for customer, rows in itertools.groupby(read_rows(path), key=lambda row: row["customer"]):
+        lines = [
+            {field: str(row[field] or "").strip() for field in ("category", "spec", "price_type")}
+            | {"quantity": row["quantity"]}
+            for row in rows
+        ]
+        yield str(customer or ""), lines
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+# 子程序內共用的價格表（由 _init_worker 載入一次）
+_catalog = None
+
+
+def _init_worker(on_date, catalog_path):
+    global _catalog
+    _catalog = load_price_catalog(on_date, catalog_path)
+
+
+def _check_lines(lines):
+    """檢查並轉換數量；回傳錯誤訊息（沒有錯誤時為 None）"""
+    for line in lines:
+        try:
+            quantity = float(line["quantity"])
+        except (TypeError, ValueError):
+            return f"數量不正確：{line['quantity']}"
+        if quantity <= 0 or quantity != int(quantity):
+            return f"數量不正確：{line['quantity']}"
+        line["quantity"] = int(quantity)
+        if (line["category"], line["spec"], line["price_type"]) not in _catalog:
+            return f"價格表沒有：{line['category']} {line['spec']} {line['price_type']}"
+    return None
+
+
+def quote_chunk(chunk):
+    """計算一批購物籃（在子程序中執行），依輸入順序回傳輸出列"""
+    rows, valid = [], []
+    for customer, lines in chunk:
+        error = _check_lines(lines)
+        rows.append({"customer": customer, "lines": len(lines), "error": error or ""})
+        if error is None:
+            valid.append((len(rows) - 1, lines))
+    if valid:
+        totals = quote_baskets(_catalog, [lines for _, lines in valid])
+        columns = {name: totals[name].tolist() for name in TOTAL_COLUMNS}
+        for i, (row_index, _) in enumerate(valid):
+            rows[row_index].update({name: values[i] for name, values in columns.items()})
+    return rows
+
+
+def quote_in_pool(chunks, workers, initargs):
+    """以程序池平行計價，依輸入順序產生結果；同時最多 workers * 2 批在處理中，記憶體不隨檔案大小增加"""
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(quote_chunk, (chunk,)))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+class ResultWriter:
+    """逐批寫出報價結果（CSV 或 openpyxl write_only 模式的 XLSX）"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        if self.path.suffix.lower() == ".csv":
+            self._file = open(self.path, "w", encoding="utf-8-sig", newline="")
+            self._writer = csv.writer(self._file)
+            self._append = self._writer.writerow
+        else:
+            import openpyxl
+
+            self._workbook = openpyxl.Workbook(write_only=True)
+            self._append = self._workbook.create_sheet("quotes").append
+        self._append(OUTPUT_COLUMNS)
+        return self
+
+    def write(self, rows):
+        for row in rows:
+            self._append([row.get(column, "") for column in OUTPUT_COLUMNS])
+
+    def __exit__(self, *exc):
+        if self.path.suffix.lower() == ".csv":
+            self._file.close()
+        else:
+            self._workbook.save(self.path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", type=Path, help="購物籃檔案（.csv 或 .xlsx）")
+    parser.add_argument("output", type=Path, help="報價結果檔案（.csv 或 .xlsx）")
+    parser.add_argument("--date", type=date.fromisoformat, default=None, help="建議書日期（選用當時生效的價格表，預設今天）")
+    parser.add_argument("--catalog", default=None, help="價格表檔案（預設 price_catalog.json）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=2000, help="每批購物籃數")
+    args = parser.parse_args(argv)
+
+    # 先在主程序載入一次，價格表有誤時直接結束
+    catalog = load_price_catalog(args.date, args.catalog)
+    print(f"價格表版本 {catalog.version}，{len(catalog.entries)} 個品項", file=sys.stderr)
+
+    chunks = chunked(read_baskets(args.input), args.chunk_size)
+    initargs = (args.date, args.catalog)
+    if args.workers > 1:
+        results = quote_in_pool(chunks, args.workers, initargs)
+    else:
+        _init_worker(*initargs)
+        results = map(quote_chunk, chunks)
+
+    baskets = lines = failed = 0
+    start = time.perf_counter()
+    with ResultWriter(args.output) as writer:
+        for rows in results:
+            writer.write(rows)
+            baskets += len(rows)
+            lines += sum(row["lines"] for row in rows)
+            failed += sum(1 for row in rows if row["error"])
+    elapsed = time.perf_counter() - start
+    print(
+        f"{baskets:,} 個購物籃（{lines:,} 個品項，{failed:,} 個錯誤），{elapsed:.2f} 秒，"
+        f"{baskets / elapsed if elapsed else 0:,.0f} 籃/秒",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
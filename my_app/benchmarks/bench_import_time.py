@@ -0,0 +1,79 @@
+"""匯入時間效能測試：以 python -X importtime 量測計價核心、批次報價與 app 的匯入成本
+
+每次在新的子程序中匯入（冷啟動），取多次中最快的一次；另列出匯入後已載入的重量級套件，
+並以原本在 app.py 開頭一次匯入的 UI 套件作為對照。
+執行方式：python my_app/benchmarks/bench_import_time.py [--repeat 5] [--top 5]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ["streamlit", "pandas", "supabase", "st_aggrid", "openpyxl", "requests", "numpy"]
+# 拆分前 app.py 開頭一次匯入的套件
+EAGER_UI_IMPORTS = ["streamlit", "supabase", "postgrest", "httpx", "pandas", "numpy", "openpyxl", "requests", "st_aggrid"]
+
+
+def import_time(modules):
+    """在新的子程序中匯入 modules，回傳 (總匯入時間 ms, {模組: (累計 ms, [(直接匯入的模組, 累計 ms)])}, 已載入的重量級套件)"""
+    code = f"import sys, {', '.join(modules)}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=APP_DIR, env={**os.environ, "PYTHONPATH": str(APP_DIR)},
+        capture_output=True, text=True, check=True,
+    )
+    timings, children = {}, []
+    for line in result.stderr.splitlines():
+        # 格式：import time: self [us] | cumulative | imported package；每深一層多縮排兩格，子模組先於上層列出
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((name.strip(), int(cumulative) / 1000))
+        elif depth == 0:
+            timings[name.strip()] = (int(cumulative) / 1000, children)
+            children = []
+    timings = {module: timings[module] for module in modules if module in timings}
+    loaded = [m for m in result.stdout.strip().splitlines()[-1].split(",") if m]
+    return sum(ms for ms, _ in timings.values()), timings, loaded
+
+
+def best_of(modules, repeat):
+    runs = [import_time(modules) for _ in range(repeat)]
+    return min(runs, key=lambda run: run[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="列出最耗時的前幾個頂層匯入")
+    args = parser.parse_args()
+
+    targets = {
+        "pricing": ["pricing"],
+        "batch_quote": ["batch_quote"],
+        "app": ["app"],
+        "eager UI imports (before)": EAGER_UI_IMPORTS,
+    }
+    print(f"{'target':<26} {'import (ms)':>12}  loaded heavy modules")
+    details = {}
+    for name, modules in targets.items():
+        total, timings, loaded = best_of(modules, args.repeat)
+        # 單一模組列出它直接匯入的模組，多個模組則比較各模組本身
+        if len(timings) == 1:
+            details[name] = next(iter(timings.values()))[1]
+        else:
+            details[name] = [(module, ms) for module, (ms, _) in timings.items()]
+        print(f"{name:<26} {total:>12.1f}  {', '.join(loaded) or '-'}")
+
+    for name, timings in details.items():
+        print(f"\n{name}: slowest imports")
+        for module, ms in sorted(timings, key=lambda item: item[1], reverse=True)[:args.top]:
+            print(f"  {module:<30} {ms:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""計價效能測試：逐列迴圈計價與 NumPy 向量化批次計價比較
+
+執行方式：python my_app/benchmarks/bench_pricing.py [--baskets 1000 10000 100000]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pricing import GreenGardenProposal, encode_baskets, price_lines  # noqa: E402
+
+
+def make_baskets(catalog, count, seed=0):
+    """產生模擬購物籃（每籃 1~4 個品項，數量 1~3）"""
+    rng = np.random.default_rng(seed)
+    keys = list(catalog.entries)
+    baskets = []
+    for size in rng.integers(1, 5, count):
+        picks = rng.choice(len(keys), size, replace=False)
+        baskets.append([
+            {"category": keys[i][0], "spec": keys[i][1], "price_type": keys[i][2], "quantity": int(q)}
+            for i, q in zip(picks, rng.integers(1, 4, size))
+        ])
+    return baskets
+
+
+def legacy_totals(catalog, baskets):
+    """原本逐籃、逐列查表並依購買方式字串分支的作法（只計算總計）"""
+    results = []
+    for basket in baskets:
+        total_original = total_discounted = total_management_fee = 0
+        total_down_payment = total_management_down_payment = 0
+        for line in basket:
+            entry = catalog.lookup(line["category"], line["spec"], line["price_type"])
+            quantity = line["quantity"]
+            product_price = entry.price * quantity
+            management_fee = entry.management_fee * quantity
+            if "現金" in line["price_type"]:
+                total_down_payment += product_price
+                total_management_down_payment += management_fee
+            else:
+                total_down_payment += entry.down_payment * quantity
+                total_management_down_payment += entry.management_down_payment * quantity
+            total_original += entry.list_price * quantity
+            total_discounted += product_price
+            total_management_fee += management_fee
+        results.append((total_original, total_discounted, total_management_fee,
+                        total_down_payment, total_management_down_payment))
+    return results
+
+
+def best_of(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--baskets", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    proposal = GreenGardenProposal()
+    print(f"{'baskets':>8} {'loop (ms)':>10} {'calculate_total (ms)':>21} {'vectorized (ms)':>16} "
+          f"{'kernel only (ms)':>17} {'baskets/s':>11}")
+    for count in args.baskets:
+        baskets = make_baskets(proposal.catalog, count)
+        loop_time = best_of(lambda: legacy_totals(proposal.catalog, baskets), args.repeat)
+        single_time = best_of(lambda: [proposal.calculate_total(basket) for basket in baskets], args.repeat)
+        batch_time = best_of(lambda: proposal.calculate_totals(baskets), args.repeat)
+        # 已編碼為產品代碼陣列時（例如由檔案欄位直接轉換）只剩向量化計算
+        codes, quantities, _ = encode_baskets(proposal.catalog, baskets)
+        kernel_time = best_of(lambda: price_lines(proposal.catalog.matrix, codes, quantities), args.repeat)
+        print(f"{count:>8} {loop_time * 1000:>10.1f} {single_time * 1000:>21.1f} "
+              f"{batch_time * 1000:>16.1f} {kernel_time * 1000:>17.1f} {count / batch_time:>11,.0f}")
+
+
+if __name__ == "__main__":
+    main()
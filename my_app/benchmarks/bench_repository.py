@@ -0,0 +1,88 @@
+"""資料來源效能測試：SupabaseRepository（本機 PostgREST 替身）與 SQLiteRepository 比較
+
+以相同資料量量測客戶分頁、搜尋與聯絡紀錄批次查詢，不需連線 Supabase。
+執行方式：python my_app/benchmarks/bench_repository.py [--customers 10000 --calls 200]
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app import (  # noqa: E402
+    CUSTOMER_GRID_COLUMNS, SQLiteRepository, SupabaseRepository, create_supabase_client,
+)
+from postgrest_stub import PostgrestStub  # noqa: E402
+
+# 替身不驗證金鑰，但 supabase-py 需要 JWT 格式的字串
+DUMMY_KEY = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.benchmark"
+
+
+def make_rows(customers, logs_per_customer):
+    customer_rows = [
+        {"id": i, "customer_name": f"客戶{i}", "phone": f"09{i:08d}", "email": f"c{i}@example.com",
+         "agent_id": f"A{i % 20:09d}"}
+        for i in range(1, customers + 1)
+    ]
+    log_rows = [
+        {"id": i, "note": f"第{n}次聯絡", "agent_id": f"A{i % 20:09d}", "contact_date": f"2025-01-{n + 1:02d}"}
+        for i in range(1, customers + 1) for n in range(logs_per_customer)
+    ]
+    return customer_rows, log_rows
+
+
+def measure(call, calls):
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return statistics.fmean(latencies), latencies[int(len(latencies) * 0.95) - 1]
+
+
+def run(repo, calls, customers):
+    scope = {"agent_id": "A000000003"}
+    ids = list(range(customers, customers - 50, -1))
+    workloads = {
+        "customer page": lambda: repo.fetch_customers_page(None, 200, CUSTOMER_GRID_COLUMNS, scope),
+        "search": lambda: repo.search_customers("客戶12", 50, scope),
+        "contact log batch": lambda: repo.fetch_contact_logs_batch(ids, 5, None),
+    }
+    return {name: measure(call, calls) for name, call in workloads.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--customers", type=int, default=10_000)
+    parser.add_argument("--logs", type=int, default=3, help="每位客戶的聯絡紀錄筆數")
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+    customer_rows, log_rows = make_rows(args.customers, args.logs)
+
+    results = {}
+    with PostgrestStub() as stub:
+        stub.seed("customers", customer_rows)
+        stub.seed("contact_logs", log_rows)
+        repo = SupabaseRepository(create_supabase_client(stub.url, DUMMY_KEY))
+        results["supabase (stub)"] = run(repo, args.calls, args.customers)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = SQLiteRepository(Path(tmp) / "bench.db")
+        for row in customer_rows:
+            repo.create_customer(row)
+        for row in log_rows:
+            repo.create_contact_log(row)
+        results["sqlite"] = run(repo, args.calls, args.customers)
+        repo.close()
+
+    print(f"{'':<18} {'workload':<18} {'mean (ms)':>10} {'p95 (ms)':>10}")
+    for backend, workloads in results.items():
+        for name, (mean, p95) in workloads.items():
+            print(f"{backend:<18} {name:<18} {mean:>10.2f} {p95:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""分期總結效能測試：原本逐期累加的字典與差分斷點掃描 payment_segments 比較
+
+兩種作法的分段需相同、金額在浮點誤差內一致；期數越長，逐期作法越慢。
+原本逐期加總浮點數的結果恰好落在 .5 元附近時，四捨五入後可能差 1 元（ties 欄），新作法為精確值。
+執行方式：python my_app/benchmarks/bench_schedule.py [--lines 3 10] [--max-terms 24 120 360]
+"""
+import argparse
+import math
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pricing import payment_segments  # noqa: E402
+
+
+def legacy_schedule(lines):
+    """原本方案詳情頁的作法：每期一個字典項目，逐品項逐期累加後再合併金額相同的連續期數
+
+    lines 為 (期數, 產品每期金額, 管理費每期金額)。
+    """
+    segments = []
+    payment_schedule = {}
+    product_payment_schedule = {}
+    management_payment_schedule = {}
+    all_terms = [terms for terms, _, _ in lines if terms]
+    if not all_terms:
+        return segments
+    max_term = max(all_terms)
+    for term in range(1, max_term + 1):
+        payment_schedule[term] = 0
+        product_payment_schedule[term] = 0
+        management_payment_schedule[term] = 0
+    for terms, product_monthly, management_monthly in lines:
+        if terms:
+            for term in range(1, terms + 1):
+                payment_schedule[term] += product_monthly + management_monthly
+                product_payment_schedule[term] += product_monthly
+                management_payment_schedule[term] += management_monthly
+
+    current_total = payment_schedule[1]
+    current_product = product_payment_schedule[1]
+    current_management = management_payment_schedule[1]
+    start_period = 1
+    for term in range(2, max_term + 2):
+        if term > max_term or payment_schedule.get(term, current_total) != current_total:
+            segments.append((start_period, term - 1, current_total, current_product, current_management))
+            if term <= max_term:
+                start_period = term
+                current_total = payment_schedule[term]
+                current_product = product_payment_schedule[term]
+                current_management = management_payment_schedule[term]
+    return segments
+
+
+def make_lines(count, max_terms, rng):
+    """產生模擬品項 (期數, 產品分期金額, 管理費分期金額)：部分為現金（沒有期數）"""
+    lines = []
+    for _ in range(count):
+        terms = rng.choice([None, rng.randint(1, max_terms)])
+        product = rng.randint(0, 3_000_000) if terms else 0
+        management = rng.randint(0, 300_000) if terms else 0
+        lines.append((terms, product, management))
+    return lines
+
+
+def monthly(lines):
+    """原本的輸入：每期金額"""
+    return [(terms, product / terms, management / terms) if terms else (terms, 0, 0) for terms, product, management in lines]
+
+
+def compare(legacy, segments):
+    """回傳 (分段與金額是否一致, 四捨五入後不同的金額數)"""
+    if [(start, end) for start, end, *_ in legacy] != [(segment.start, segment.end) for segment in segments]:
+        return False, 0
+    pairs = [(a, b) for old, new in zip(legacy, segments) for a, b in zip(old[2:], new[2:])]
+    close = all(math.isclose(a, b, rel_tol=1e-9) for a, b in pairs)
+    return close, sum(f"{a:,.0f}" != f"{b:,.0f}" for a, b in pairs)
+
+
+def best_of(func, baskets, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for lines in baskets:
+            func(lines)
+        best = min(best, time.perf_counter() - start)
+    return best / len(baskets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, nargs="+", default=[3, 10])
+    parser.add_argument("--max-terms", type=int, nargs="+", default=[24, 120, 360])
+    parser.add_argument("--baskets", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(f"{'lines':>6} {'max terms':>10} {'per-term (us)':>14} {'segments (us)':>14} {'speedup':>8} {'same':>5} {'ties':>5}")
+    for count in args.lines:
+        for max_terms in args.max_terms:
+            baskets = [make_lines(count, max_terms, rng) for _ in range(args.baskets)]
+            legacy_baskets = [monthly(lines) for lines in baskets]
+            results = [compare(legacy_schedule(old), payment_segments(new)) for old, new in zip(legacy_baskets, baskets)]
+            legacy_time = best_of(legacy_schedule, legacy_baskets, args.repeat)
+            fast_time = best_of(payment_segments, baskets, args.repeat)
+            print(f"{count:>6} {max_terms:>10} {legacy_time * 1e6:>14.1f} {fast_time * 1e6:>14.1f} "
+                  f"{legacy_time / fast_time:>7.1f}x {str(all(same for same, _ in results)):>5} "
+                  f"{sum(ties for _, ties in results):>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Supabase client 效能測試：每次呼叫 create_client 與程序共用連線池 client 比較
+
+以本機 PostgREST 替身量測單次查詢延遲，不需連線 Supabase。
+執行方式：python my_app/benchmarks/bench_supabase_client.py [--calls 200]
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from supabase import create_client  # noqa: E402
+
+from app import create_supabase_client  # noqa: E402
+from postgrest_stub import PostgrestStub  # noqa: E402
+
+# 替身不驗證金鑰，但 supabase-py 需要 JWT 格式的字串
+DUMMY_KEY = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.benchmark"
+
+
+def measure(call, calls):
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "mean": statistics.fmean(latencies),
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=50)
+    args = parser.parse_args()
+
+    with PostgrestStub() as stub:
+        stub.seed("customers", [
+            {"customer_name": f"客戶{i}", "phone": f"09{i:08d}", "email": f"c{i}@example.com"}
+            for i in range(args.rows)
+        ])
+
+        def per_call_client():
+            client = create_client(stub.url, DUMMY_KEY)
+            client.table("customers").select("*").order("id", desc=True).execute()
+
+        shared = create_supabase_client(stub.url, DUMMY_KEY)
+
+        def shared_client():
+            shared.table("customers").select("*").order("id", desc=True).execute()
+
+        shared_client()  # 預先建立連線
+        results = {
+            "create_client per call": measure(per_call_client, args.calls),
+            "shared pooled client": measure(shared_client, args.calls),
+        }
+
+    print(f"{'':<24} {'mean (ms)':>10} {'p50 (ms)':>10} {'p95 (ms)':>10}")
+    for name, stats in results.items():
+        print(f"{name:<24} {stats['mean']:>10.2f} {stats['p50']:>10.2f} {stats['p95']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""本機 PostgREST 替身：以記憶體保存資料表，供效能測試使用（不需連線 Supabase）
+
+僅支援 app.py 用到的查詢子集：select 欄位、eq / gt / gte / lt / in / ilike 與 or 篩選、order、limit，
+以及 POST（insert / upsert）、PATCH、DELETE。
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from urllib.parse import parse_qsl, urlsplit
+
+PRIMARY_KEYS = {"customers": "id", "contact_logs": "contact_id"}
+
+
+def _coerce(value):
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def _ilike(value, pattern):
+    needle = pattern.strip("*%").lower()
+    return value is not None and needle in str(value).lower()
+
+
+def _matches(row, filters):
+    for column, expression in filters:
+        if column == "or":
+            conditions = [c.split(".", 2) for c in expression.strip("()").split(",")]
+            if not any(op == "ilike" and _ilike(row.get(c), raw) for c, op, raw in conditions):
+                return False
+            continue
+        op, _, raw = expression.partition(".")
+        value = row.get(column)
+        if op == "ilike" and not _ilike(value, raw):
+            return False
+        if op == "eq" and str(value) != raw:
+            return False
+        if op == "gt" and not (value is not None and value > _coerce(raw)):
+            return False
+        if op == "lt" and not (value is not None and value < _coerce(raw)):
+            return False
+        if op == "gte" and not (value is not None and value >= _coerce(raw)):
+            return False
+        if op == "in" and str(value) not in raw.strip("()").split(","):
+            return False
+    return True
+
+
+class PostgrestStub:
+    """以 ThreadingHTTPServer 提供 /rest/v1/<table> 端點"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        self.tables = {name: {} for name in PRIMARY_KEYS}
+        self.ids = {name: count(1) for name in PRIMARY_KEYS}
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def seed(self, table, rows):
+        with self._lock:
+            key = PRIMARY_KEYS[table]
+            for row in rows:
+                row = dict(row)
+                row.setdefault(key, next(self.ids[table]))
+                self.tables[table][row[key]] = row
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _query(self, table, params):
+        filters = [(k, v) for k, v in params if k not in ("select", "order", "limit", "on_conflict", "columns")]
+        rows = [row for row in self.tables[table].values() if _matches(row, filters)]
+        options = dict(params)
+        if "order" in options:
+            column, _, direction = options["order"].partition(".")
+            rows.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=direction.startswith("desc"))
+        if "limit" in options:
+            rows = rows[:int(options["limit"])]
+        select = options.get("select", "*")
+        if select != "*":
+            columns = select.split(",")
+            rows = [{c: row.get(c) for c in columns} for row in rows]
+        return filters, rows
+
+    def _make_handler(stub):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, payload=None):
+                body = json.dumps(payload, ensure_ascii=False).encode() if payload is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _parse(self):
+                parts = urlsplit(self.path)
+                table = parts.path.rstrip("/").rsplit("/", 1)[-1]
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                return table, parse_qsl(parts.query), body
+
+            def _handle(self, method):
+                if stub.latency:
+                    threading.Event().wait(stub.latency)
+                table, params, body = self._parse()
+                if table not in stub.tables:
+                    return self._send(404, {"message": f"relation {table} does not exist"})
+                minimal = "return=minimal" in (self.headers.get("Prefer") or "")
+                key = PRIMARY_KEYS[table]
+                with stub._lock:
+                    stub.requests += 1
+                    if method == "GET":
+                        return self._send(200, stub._query(table, params)[1])
+                    if method == "POST":
+                        rows = body if isinstance(body, list) else [body]
+                        conflict = dict(params).get("on_conflict")
+                        ignore = "ignore-duplicates" in (self.headers.get("Prefer") or "")
+                        created = []
+                        for row in rows:
+                            row = dict(row)
+                            if conflict and conflict != key:
+                                # upsert 以其他唯一欄位（例如 client_key）判斷重複
+                                match = next((r for r in stub.tables[table].values()
+                                              if r.get(conflict) == row.get(conflict)), None)
+                                if match is not None:
+                                    if not ignore:
+                                        match.update(row)
+                                    continue
+                            if row.get(key) is None:
+                                row[key] = next(stub.ids[table])
+                            stub.tables[table].setdefault(row[key], {}).update(row)
+                            created.append(stub.tables[table][row[key]])
+                        return self._send(201, None if minimal else created)
+                    _, rows = stub._query(table, [p for p in params if p[0] != "select"])
+                    if method == "PATCH":
+                        for row in rows:
+                            row.update(body)
+                        return self._send(204 if minimal else 200, None if minimal else rows)
+                    if method == "DELETE":
+                        for row in rows:
+                            del stub.tables[table][row[key]]
+                        return self._send(200, rows)
+                return self._send(405)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def do_PATCH(self):
+                self._handle("PATCH")
+
+            def do_DELETE(self):
+                self._handle("DELETE")
+
+        return Handler
@@ -0,0 +1,25 @@
+"""綠金園建議書計價核心：價格表載入與驗證、向量化計價引擎與分期總結
+
+只依賴標準函式庫與 NumPy，不載入 Streamlit，可供批次報價（batch_quote.py）等程式直接使用。
+"""
+from .catalog import (
+    PRICE_CATALOG_PATH,
+    PRODUCT_TYPES,
+    CatalogError,
+    PriceCatalog,
+    PriceCatalogHistory,
+    PriceEntry,
+    load_price_catalog,
+    load_price_history,
+    merge_catalog_data,
+)
+from .engine import build_price_matrix, encode_baskets, price_lines, quote_baskets
+from .proposal import GreenGardenProposal
+from .schedule import PaymentSegment, installment_payment, payment_segments
+
+__all__ = [
+    "PRICE_CATALOG_PATH", "PRODUCT_TYPES", "CatalogError", "PriceCatalog", "PriceCatalogHistory", "PriceEntry",
+    "load_price_catalog", "load_price_history", "merge_catalog_data",
+    "build_price_matrix", "encode_baskets", "price_lines", "quote_baskets",
+    "GreenGardenProposal", "PaymentSegment", "installment_payment", "payment_segments",
+]
@@ -0,0 +1,207 @@
+"""價格表：載入與驗證 price_catalog.json、各版價格表與依日期選用"""
+import json
+import os
+import threading
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import date
+from pathlib import Path
+from types import MappingProxyType
+
+from .engine import build_price_matrix
+
+# 價格表檔案放在 app.py 旁
+PRICE_CATALOG_PATH = Path(__file__).parent.with_name("price_catalog.json")
+PRODUCT_TYPES = ("cemetery", "memorial")
+# 產品資料中不是購買方式的欄位（另有「團購-管理費」等 <方案>-管理費）
+PRICE_META_FIELDS = ("定價", "分期期數", "管理費")
+
+PriceEntry = namedtuple("PriceEntry", [
+    "product_type", "category", "spec", "price_type",
+    "list_price", "price", "management_fee", "installment_terms",
+    "down_payment", "management_down_payment",
+])
+
+
+class CatalogError(ValueError):
+    """價格表格式或內容錯誤"""
+
+
+class PriceCatalog:
+    """編譯後的價格表：以 (園區/廳別, 產品, 購買方式) 為鍵的扁平唯讀查詢表
+
+    分期的購買方式必須有分期期數、頭款與管理費頭款，缺少時拋出 CatalogError。
+    """
+
+    def __init__(self, data, source=None, effective_from=None):
+        self.version = str(data.get("version", ""))
+        self.source = source
+        self.effective_from = effective_from
+        entries, errors = self._compile(data)
+        if errors:
+            raise CatalogError("價格表驗證失敗：" + "；".join(errors))
+        self.entries = MappingProxyType(entries)
+        # 計價引擎用：產品代碼與以代碼為索引的價格陣列
+        self.codes = MappingProxyType({key: code for code, key in enumerate(entries)})
+        self.matrix = build_price_matrix(entries.values())
+        # 選單用：{產品類型: {園區/廳別: {產品: (購買方式, ...)}}}，依檔案中的順序
+        menu = {product_type: {} for product_type in PRODUCT_TYPES}
+        for (category, spec, price_type), entry in entries.items():
+            menu[entry.product_type].setdefault(category, {}).setdefault(spec, []).append(price_type)
+        self._menu = {
+            product_type: {category: {spec: tuple(types) for spec, types in specs.items()} for category, specs in categories.items()}
+            for product_type, categories in menu.items()
+        }
+
+    @staticmethod
+    def _compile(data):
+        entries, errors = {}, []
+        # 價格表中出現過的購買方式（包含值為 null、已停售的）
+        declared = set()
+        down_payments = data.get("down_payments", {})
+        management_down_payments = data.get("management_down_payments", {})
+        for product_type in PRODUCT_TYPES:
+            for category, specs in data.get(product_type, {}).items():
+                for spec, fields in specs.items():
+                    name = f"{category}/{spec}"
+                    if not isinstance(fields.get("定價"), (int, float)):
+                        errors.append(f"{name} 缺少定價")
+                        continue
+                    terms = fields.get("分期期數")
+                    declared.update((category, spec, price_type) for price_type in fields)
+                    for price_type, price in fields.items():
+                        if price_type in PRICE_META_FIELDS or price_type.endswith("-管理費") or price is None:
+                            continue
+                        if not isinstance(price, (int, float)):
+                            errors.append(f"{name} {price_type} 價格不是數字")
+                            continue
+                        # 團購等方案有自己的管理費時（例如「團購-管理費」）優先使用
+                        plan = price_type.split("-")[0] if "-" in price_type else None
+                        management_fee = fields.get(f"{plan}-管理費", fields.get("管理費", 0)) if plan else fields.get("管理費", 0)
+                        down_payment = management_down_payment = None
+                        if "分期" in price_type:
+                            down_payment = down_payments.get(category, {}).get(spec, {}).get(price_type)
+                            management_down_payment = management_down_payments.get(category, {}).get(spec, {}).get(price_type)
+                            if not terms:
+                                errors.append(f"{name} {price_type} 缺少分期期數")
+                            if down_payment is None:
+                                errors.append(f"{name} {price_type} 缺少頭款")
+                            if management_down_payment is None:
+                                errors.append(f"{name} {price_type} 缺少管理費頭款")
+                        entries[(category, spec, price_type)] = PriceEntry(
+                            product_type, category, spec, price_type,
+                            fields["定價"], price, management_fee or 0,
+                            terms if "分期" in price_type else None,
+                            down_payment, management_down_payment,
+                        )
+        # 頭款表中找不到對應產品的項目多半是打錯字
+        for table_name, table in (("頭款", down_payments), ("管理費頭款", management_down_payments)):
+            for category, specs in table.items():
+                for spec, payments in specs.items():
+                    for price_type in payments:
+                        if (category, spec, price_type) not in declared:
+                            errors.append(f"{table_name} {category}/{spec} {price_type} 沒有對應的產品價格")
+        return entries, errors
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def lookup(self, category, spec, price_type):
+        return self.entries[(category, spec, price_type)]
+
+    def categories(self, product_type):
+        return list(self._menu[product_type])
+
+    def specs(self, product_type, category):
+        return list(self._menu[product_type].get(category, {}))
+
+    def price_types(self, product_type, category, spec):
+        return list(self._menu[product_type].get(category, {}).get(spec, ()))
+
+
+def merge_catalog_data(base, overlay):
+    """將調價內容疊加到上一版價格資料（逐層合併，只需列出有變動的欄位）"""
+    merged = dict(base)
+    for key, value in overlay.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_catalog_data(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class PriceCatalogHistory:
+    """依生效日期排序的各版價格表，以二分搜尋找出指定日期適用的版本
+
+    檔案最上層為第一版（effective_from 為 null 表示一直適用到第一次調價），
+    revisions 為之後的調價，每項有 version、effective_from（YYYY-MM-DD）與有變動的價格欄位，
+    依日期累加在前一版之上。載入時即編譯並驗證所有版本，查詢為 O(log n)。
+    """
+
+    def __init__(self, data, source=None):
+        data = dict(data)
+        revisions = data.pop("revisions", None) or []
+        try:
+            first = date.fromisoformat(data["effective_from"]) if data.get("effective_from") else date.min
+            revisions = sorted(
+                ((date.fromisoformat(revision["effective_from"]), revision) for revision in revisions),
+                key=lambda item: item[0],
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            raise CatalogError(f"價格表生效日期格式錯誤：{e}") from e
+
+        self.source = source
+        self.effective_dates = [first]
+        self.catalogs = [PriceCatalog(data, source, first)]
+        merged = data
+        for effective_from, revision in revisions:
+            if effective_from <= self.effective_dates[-1]:
+                raise CatalogError(f"價格表生效日期重複或早於第一版：{effective_from}")
+            merged = merge_catalog_data(merged, {key: value for key, value in revision.items() if key != "effective_from"})
+            self.effective_dates.append(effective_from)
+            self.catalogs.append(PriceCatalog(merged, source, effective_from))
+
+    @classmethod
+    def from_file(cls, path):
+        path = Path(path)
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f), source=str(path))
+
+    def for_date(self, on_date=None):
+        """on_date 當天生效的版本；早於第一版生效日時使用第一版"""
+        index = bisect_right(self.effective_dates, on_date or date.today()) - 1
+        return self.catalogs[max(index, 0)]
+
+
+# 程序內的價格表快取 {路徑: (檔案修改時間, PriceCatalogHistory)}
+_catalog_cache = {}
+_catalog_lock = threading.Lock()
+
+
+def load_price_catalog(on_date=None, path=None):
+    """on_date（預設今天）適用的價格表版本；path 預設為環境變數 PRICE_CATALOG_PATH 或 price_catalog.json"""
+    return load_price_history(path).for_date(on_date)
+
+
+def load_price_history(path=None):
+    """程序共用的各版價格表：檔案修改時間改變時重新載入；新檔案驗證失敗時沿用已載入的版本"""
+    path = str(path or os.environ.get("PRICE_CATALOG_PATH") or PRICE_CATALOG_PATH)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _catalog_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with _catalog_lock:
+        cached = _catalog_cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            catalog = PriceCatalogHistory.from_file(path)
+        except (OSError, ValueError) as e:
+            if cached is None:
+                raise
+            print("Price catalog reload error:", e)
+            # 記下這個修改時間，同一個錯誤檔案不重複解析
+            _catalog_cache[path] = (mtime, cached[1])
+            return cached[1]
+        _catalog_cache[path] = (mtime, catalog)
+        return catalog
@@ -0,0 +1,92 @@
+"""建議書計價：單一購物籃的總計與明細，以及批次計價"""
+from .catalog import load_price_catalog
+from .engine import encode_baskets, price_lines, quote_baskets
+from .schedule import installment_payment, payment_segments
+
+
+class GreenGardenProposal:
+    def __init__(self, catalog=None, proposal_date=None):
+        # 價格表由 price_catalog.json 載入，依建議書日期選用當時生效的版本
+        self.catalog = catalog or load_price_catalog(proposal_date)
+
+    def get_down_payment(self, category, spec, product_price, price_type, quantity):
+        """取得頭款金額"""
+        if '現金' in price_type:
+            return product_price
+        else:
+            return self.catalog.lookup(category, spec, price_type).down_payment * quantity
+
+    def get_management_down_payment(self, category, spec, management_fee, price_type, quantity):
+        """取得管理費頭款"""
+        if '現金' in price_type:
+            return management_fee
+        else:
+            return self.catalog.lookup(category, spec, price_type).management_down_payment * quantity
+
+    def calculate_installment_payment(self, product_price, management_fee, installment_terms, down_payment_amount, management_down_payment_amount):
+        """計算分期付款"""
+        return installment_payment(product_price + management_fee, down_payment_amount + management_down_payment_amount, installment_terms)
+
+    def calculate_product_installment_payment(self, product_price, installment_terms, down_payment_amount):
+        """計算產品分期付款"""
+        return installment_payment(product_price, down_payment_amount, installment_terms)
+
+    def calculate_management_installment_payment(self, management_fee, installment_terms, management_down_payment_amount):
+        """計算管理費分期付款"""
+        return installment_payment(management_fee, management_down_payment_amount, installment_terms)
+
+    def calculate_total(self, selected_products):
+        """單一購物籃的總計、明細與分期總結（以向量化計價引擎計算）"""
+        codes, quantities, _ = encode_baskets(self.catalog, [selected_products])
+        lines = {name: values.tolist() for name, values in price_lines(self.catalog.matrix, codes, quantities).items()}
+
+        product_details = []
+        for i, product in enumerate(selected_products):
+            price_type = product['price_type']
+            installment_terms = lines['installment_terms'][i] or None
+
+            # 購買方式顯示
+            display_price_type = price_type
+            if installment_terms:
+                display_price_type = f"{price_type}-{installment_terms}期"
+
+            product_details.append({
+                'category': product['category'],
+                'spec': product['spec'],
+                'quantity': product['quantity'],
+                'price_type': display_price_type,
+                'original_price': lines['original_price'][i],
+                'product_price': lines['product_price'][i],
+                'management_fee_per_unit': lines['management_fee_per_unit'][i],
+                'management_fee': lines['management_fee'][i],
+                'installment_terms': installment_terms,
+                'product_down_payment': lines['product_down_payment'][i],
+                'product_monthly_payment': lines['product_monthly_payment'][i] if installment_terms else 0,
+                'management_down_payment': lines['management_down_payment'][i],
+                'management_monthly_payment': lines['management_monthly_payment'][i] if installment_terms else 0
+            })
+
+        total_original = sum(lines['original_price'])
+        total_discounted = sum(lines['product_price'])
+        total_management_fee = sum(lines['management_fee'])
+        discount_rate = (total_original - total_discounted) / total_original if total_original > 0 else 0
+
+        return {
+            "total_original": total_original,
+            "total_discounted": total_discounted,
+            "total_management_fee": total_management_fee,
+            "total_down_payment": sum(lines['product_down_payment']),
+            "total_management_down_payment": sum(lines['management_down_payment']),
+            "discount_rate": discount_rate,
+            "final_total": total_discounted + total_management_fee,
+            "product_details": product_details,
+            "payment_schedule": payment_segments(
+                (detail['installment_terms'], detail['product_price'] - detail['product_down_payment'],
+                 detail['management_fee'] - detail['management_down_payment'])
+                for detail in product_details
+            ),
+        }
+
+    def calculate_totals(self, baskets):
+        """一次計算多個購物籃（報表、批次報價用），回傳 {欄位: 每個購物籃一個值的 NumPy 陣列}"""
+        return quote_baskets(self.catalog, baskets)
@@ -0,0 +1,55 @@
+"""分期付款：扣除頭款後的每期金額，以及整張建議書的分期總結"""
+from collections import namedtuple
+from math import lcm
+
+# 第 start~end 期每期繳 total（產品 product、管理費 management）
+PaymentSegment = namedtuple("PaymentSegment", ["start", "end", "total", "product", "management"])
+
+
+def installment_payment(amount, down_payment_amount, installment_terms):
+    """每期金額：(金額 - 頭款) / 期數；沒有期數時為 0"""
+    if not installment_terms:
+        return 0
+    return (amount - down_payment_amount) / installment_terms
+
+
+def payment_segments(lines):
+    """分期總結：每期金額相同的連續期數合併為一段，回傳依期數排序的 [PaymentSegment]
+
+    lines 為 (期數, 產品分期金額, 管理費分期金額)，分期金額為扣除頭款後平均分攤到各期的總額，
+    期數為空的品項略過。所有分期都從第 1 期開始，第 期數+1 期起不再繳，因此以差分方式只在
+    各期數斷點記下減少的金額，排序斷點後掃過一次，複雜度 O(n log n)，與期數長短無關。
+    """
+    lines = [line for line in lines if line[0]]
+    if not lines:
+        return []
+    # 以各期數的最小公倍數為分母，每期金額都是整數分子：加減沒有誤差，結果與品項順序無關
+    denominator = lcm(*(terms for terms, _, _ in lines))
+    product_total = management_total = 0
+    # 斷點（不再繳的第一期）-> 自該期起減少的 (產品, 管理費) 每期金額分子
+    decreases = {}
+    for terms, product, management in lines:
+        scale = denominator // terms
+        product, management = product * scale, management * scale
+        product_total += product
+        management_total += management
+        ended_product, ended_management = decreases.get(terms + 1, (0, 0))
+        decreases[terms + 1] = (ended_product + product, ended_management + management)
+
+    segments = []
+    start, previous_total = 1, None
+    for breakpoint in sorted(decreases):
+        total = product_total + management_total
+        if total == previous_total:
+            # 結束的品項分期金額為 0 時前後兩段金額相同，合併為一段
+            segments[-1] = segments[-1]._replace(end=breakpoint - 1)
+        else:
+            segments.append(PaymentSegment(
+                start, breakpoint - 1,
+                total / denominator, product_total / denominator, management_total / denominator,
+            ))
+        ended_product, ended_management = decreases[breakpoint]
+        product_total -= ended_product
+        management_total -= ended_management
+        start, previous_total = breakpoint, total
+    return segments
@@ -0,0 +1,127 @@
+-- Supabase（PostgreSQL）索引：於 Supabase SQL Editor 執行一次即可
+-- app.py 的查詢依賴以下索引，資料量增加時查詢時間才不會隨整張表成長
+
+-- 客戶搜尋（search_customers）：ilike '%關鍵字%' 需要 pg_trgm 的 GIN 索引
+create extension if not exists pg_trgm;
+
+create index if not exists customers_customer_name_trgm_idx
+    on customers using gin (customer_name gin_trgm_ops);
+create index if not exists customers_phone_trgm_idx
+    on customers using gin (phone gin_trgm_ops);
+create index if not exists customers_email_trgm_idx
+    on customers using gin (email gin_trgm_ops);
+
+-- 資料範圍（get_customer_scope）：每位業務只查詢自己的客戶，預設以 agent_id 篩選，
+-- customer_scope=office 時以 office 篩選；create_customer 會寫入這兩個欄位
+alter table customers add column if not exists agent_id text;
+alter table customers add column if not exists office text;
+
+-- 既有客戶回填擁有者：新增欄位後既有客戶的 agent_id / office 皆為 NULL，預設範圍下任何業務都看不到，
+-- 需在啟用 app 的資料範圍前執行（可重複執行，只更新仍為 NULL 的列）
+-- 1. agent_id：以該客戶最近一筆聯絡紀錄的業務為擁有者（contact_logs.agent_id 一直由 create_contact_log 寫入）
+update customers c
+set agent_id = l.agent_id
+from (
+    select distinct on (id) id, agent_id
+    from contact_logs
+    where agent_id is not null
+    order by id, contact_date desc, contact_id desc
+) as l
+where c.id = l.id and c.agent_id is null;
+
+-- 2. office：依業務名單（在職業務名單.xlsx 的 業務身份證字號、營業處 兩欄）對應，
+--    將名單匯入 agent_offices（Supabase Table Editor 可直接匯入 CSV；身份證字號需為大寫）後執行
+create table if not exists agent_offices (agent_id text primary key, office text not null);
+update customers c
+set office = a.office
+from agent_offices a
+where c.agent_id = a.agent_id and c.office is null;
+
+-- 3. 沒有任何聯絡紀錄的客戶無法自動判斷擁有者，以下查詢列出後需人工指定 agent_id 與 office
+-- select id, customer_name, phone, email from customers where agent_id is null or office is null order by id;
+
+-- 分頁依 (範圍, id desc) 排序，複合索引讓每頁查詢只讀取該業務的資料
+create index if not exists customers_agent_id_id_idx on customers (agent_id, id desc);
+create index if not exists customers_office_id_idx on customers (office, id desc);
+
+-- 聯絡紀錄：依客戶與業務篩選、依 contact_date 排序
+create index if not exists contact_logs_id_contact_date_idx on contact_logs (id, contact_date desc);
+create index if not exists contact_logs_agent_id_contact_date_idx on contact_logs (agent_id, contact_date desc);
+
+-- 延後寫入佇列（WriteBehindQueue）：新增資料帶有 client_key 冪等鍵，
+-- 以 upsert(on_conflict=client_key, ignore-duplicates) 重送時不會重複新增
+-- 大量匯入（import_customers）也以 import:<電話或Email雜湊> 作為 client_key，重複匯入同一位客戶會略過
+alter table customers add column if not exists client_key text;
+alter table contact_logs add column if not exists client_key text;
+create unique index if not exists customers_client_key_idx on customers (client_key);
+create unique index if not exists contact_logs_client_key_idx on contact_logs (client_key);
+
+-- 聯絡紀錄時間軸以 (contact_date, contact_id) 做 keyset 分頁
+create index if not exists contact_logs_id_date_contact_id_idx
+    on contact_logs (id, contact_date desc, contact_id desc);
+
+-- 每位客戶最新 N 筆聯絡紀錄（設定 contact_log_rpc 時 fetch_contact_logs_batch 會呼叫）
+create or replace function latest_contact_logs(customer_ids bigint[], per_customer int, agent text default null)
+returns setof contact_logs
+language sql stable
+as $$
+    select l.*
+    from unnest(customer_ids) as c(customer_id)
+    cross join lateral (
+        select *
+        from contact_logs
+        where contact_logs.id = c.customer_id
+          and (agent is null or contact_logs.agent_id = agent)
+        order by contact_date desc, contact_id desc
+        limit per_customer
+    ) as l;
+$$;
+
+-- 增量同步（CustomerSync）：以 updated_at 高水位只取回變更的客戶
+alter table customers add column if not exists updated_at timestamptz not null default now();
+
+create or replace function set_updated_at() returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+drop trigger if exists customers_set_updated_at on customers;
+create trigger customers_set_updated_at
+    before update on customers
+    for each row execute function set_updated_at();
+
+create index if not exists customers_agent_id_updated_at_idx on customers (agent_id, updated_at, id);
+create index if not exists customers_office_updated_at_idx on customers (office, updated_at, id);
+
+-- 匯出（write_export）依主鍵遞增做 keyset 分頁；聯絡紀錄依業務匯出時使用 (agent_id, contact_id)
+-- 依營業處匯出聯絡紀錄時以 customers!inner(office) 關聯客戶，需要 contact_logs.id -> customers.id 的外鍵
+create index if not exists contact_logs_agent_id_contact_id_idx on contact_logs (agent_id, contact_id);
+
+-- 重複客戶檢查：電話（全形轉半形、只保留數字，台灣手機統一為 09 開頭）與 Email（小寫）的唯一函數索引，
+-- 規則與 app.py 的 normalize_phone / normalize_email 相同。建立前需先合併既有的重複客戶，可用下列查詢找出：
+--   select normalize_phone(phone), array_agg(id) from customers
+--   where normalize_phone(phone) is not null group by 1 having count(*) > 1;
+create or replace function normalize_phone(phone text) returns text
+language sql immutable parallel safe
+as $$
+    select nullif(
+        case
+            when digits ~ '^886[0-9]{9}$' then '0' || substr(digits, 4)
+            when digits ~ '^9[0-9]{8}$' then '0' || digits
+            else digits
+        end, '')
+    from (select regexp_replace(normalize(coalesce(phone, ''), NFKC), '[^0-9]', '', 'g') as digits) as t
+$$;
+
+create or replace function normalize_email(email text) returns text
+language sql immutable parallel safe
+as $$
+    select nullif(lower(btrim(normalize(coalesce(email, ''), NFKC))), '')
+$$;
+
+create unique index if not exists customers_phone_key_idx on customers (normalize_phone(phone));
+create unique index if not exists customers_email_key_idx on customers (normalize_email(email));
@@ -0,0 +1,5 @@
+"""測試時以 my_app 為匯入根目錄（與 app.py、batch_quote.py 執行時相同）"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,83 @@
+"""計價回歸測試：固定購物籃的總計與分期總結，以及批次計價與單筆計價一致
+
+預期值取自改為價格表（price_catalog.json）之前、寫死價格的 GreenGardenProposal.calculate_total。
+"""
+import random
+
+import pytest
+
+from pricing import GreenGardenProposal, load_price_catalog
+
+TOTAL_FIELDS = (
+    "total_original", "total_discounted", "total_management_fee",
+    "total_down_payment", "total_management_down_payment", "final_total",
+)
+
+# (品項 [(園區/廳別, 產品, 購買方式, 數量)], 總計（同 TOTAL_FIELDS 順序）, 分期總結 [(起, 迄, 產品每期, 管理費每期)])
+GOLDEN_BASKETS = [
+    ([("澤茵園", "單灰位", "預購-現金價", 1)],
+     (460000, 276000, 50200, 276000, 50200, 326200), []),
+    ([("澤茵園", "家福4灰", "分期價", 2)],
+     (1900000, 1197000, 207400, 361800, 63400, 1404400), [(1, 24, 34800, 6000)]),
+    ([("天意園一期", "永念2灰", "分期價", 1), ("澤茵園", "家福4灰", "分期價", 1)],
+     (1150000, 726500, 125600, 218900, 38300, 852100), [(1, 18, 22400, 3850), (19, 24, 17400, 3000)]),
+    ([("恩典園一期", "晨星2灰", "團購-分期價", 2), ("永願樓-大佛廳", "牌位6、7層", "單購-分期價", 1),
+      ("澤茵園", "單灰位", "預購-現金價", 1)],
+     (1150000, 686500, 106140, 374500, 86400, 792640), [(1, 18, 15500, 3290 / 3), (19, 24, 5500, 0)]),
+    ([("永願樓-彌陀廳", "牌位6、9層", "單購-分期價", 3), ("永願樓-普羅廳", "牌位8、9層", "單購-現金價", 1)],
+     (850000, 528000, 92000, 227760, 92000, 620000), [(1, 24, 12510, 0)]),
+    ([("天璽文創園一期A區", "寶祥9灰", "分期價", 1), ("恩典園一期", "安然特區4灰", "分期價", 2)],
+     (4896000, 3071880, 581400, 688080, 136200, 3653280), [(1, 24, 73900, 13600), (25, 42, 33900, 6600)]),
+    ([], (0, 0, 0, 0, 0, 0), []),
+]
+
+
+def make_basket(items):
+    return [
+        {"category": category, "spec": spec, "price_type": price_type, "quantity": quantity}
+        for category, spec, price_type, quantity in items
+    ]
+
+
+@pytest.fixture(scope="module")
+def proposal():
+    return GreenGardenProposal()
+
+
+@pytest.mark.parametrize("items, totals, schedule", GOLDEN_BASKETS)
+def test_calculate_total_matches_legacy(proposal, items, totals, schedule):
+    result = proposal.calculate_total(make_basket(items))
+    assert tuple(result[field] for field in TOTAL_FIELDS) == totals
+    segments = [(s.start, s.end, s.product, s.management) for s in result["payment_schedule"]]
+    assert segments == [pytest.approx(segment) for segment in schedule]
+    for segment in result["payment_schedule"]:
+        assert segment.total == pytest.approx(segment.product + segment.management)
+
+
+def random_baskets(count, seed=1):
+    """以價格表所有品項隨機組成購物籃（固定亂數種子）"""
+    entries = list(load_price_catalog().entries.values())
+    rng = random.Random(seed)
+    return [
+        [
+            {"category": entry.category, "spec": entry.spec, "price_type": entry.price_type, "quantity": rng.randint(1, 10)}
+            for entry in rng.sample(entries, rng.randint(0, 6))
+        ]
+        for _ in range(count)
+    ]
+
+
+def test_calculate_totals_matches_calculate_total(proposal):
+    baskets = [make_basket(items) for items, _, _ in GOLDEN_BASKETS] + random_baskets(300)
+    batch = proposal.calculate_totals(baskets)
+    for i, basket in enumerate(baskets):
+        result = proposal.calculate_total(basket)
+        for field in TOTAL_FIELDS:
+            assert batch[field][i] == result[field], field
+        assert batch["discount_rate"][i] == pytest.approx(result["discount_rate"])
+        schedule = result["payment_schedule"]
+        first = schedule[0] if schedule else None
+        assert batch["first_product_monthly_payment"][i] == pytest.approx(first.product if first else 0)
+        assert batch["first_management_monthly_payment"][i] == pytest.approx(first.management if first else 0)
+        assert batch["first_monthly_payment"][i] == pytest.approx(first.total if first else 0)
+        assert batch["max_installment_terms"][i] == (schedule[-1].end if schedule else 0)